@@ -1,3 +1,14 @@
+from .async_requests import HttpPool
+from .instrument import Instrumentation, JsonLinesSink, LoggingSink, MemorySink, get_instrumentation, set_instrumentation
+from .journey_tables import JourneyTables
+from .listing_index import ListingIndex
+from .listing_query import All, Any, Between, IsIn, ListingQuery, Not, Within
+from .listing_store import ListingStore
 from .postcodes import Postcodes
+from .postcode_store import PostcodeStore, lookup_latlongs
+from .request_planner import RequestPlan, plan_requests
+from .response_cache import ResponseCache
 from .rightmove import Rightmove
-from .tfl import JourneyPlanner, journey_times_updater
\ No newline at end of file
+from .sector_stats import SectorStats
+from .tfl import JourneyMatrix, JourneyPlanner, journey_times_updater
+from .travel_raster import TravelTimeRaster
@@ -1,51 +1,332 @@
 import asyncio
+import random
 import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
 import aiohttp
 
+from .instrument import count, observe
+
+class RetryableStatus(Exception):
+    def __init__(self, status, retryAfter=None):
+        super().__init__(status, retryAfter)
+        self.status = status
+        self.retryAfter = retryAfter
+
+class RateLimiter(object):
+    '''
+    Token bucket allowing bursts of up to 'burst' requests at a sustained 'rate' per second, plus an optional cap on
+    requests in flight. Can be shared by several AsyncRequests sessions that hit the same API.
+    '''
+    def __init__(self, rate, burst=1, maxInFlight=None):
+        self.rate = rate
+        self.burst = burst
+        self.maxInFlight = maxInFlight
+
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.pausedUntil = 0
+        self._lock = None
+        self._semaphore = None
+
+    async def acquire(self):
+        '''
+        Waits for a free in-flight slot and then for a token. Must be paired with release().
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._semaphore = asyncio.Semaphore(self.maxInFlight) if self.maxInFlight else None
+
+        if self._semaphore:
+            await self._semaphore.acquire()
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    if now < self.pausedUntil:
+                        await asyncio.sleep(self.pausedUntil - now)
+                        continue
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        if self._semaphore:
+            self._semaphore.release()
+
+    def pause(self, seconds):
+        '''
+        Stops handing out tokens for 'seconds' (e.g. after a 429 with a Retry-After header) and drops any saved burst.
+        '''
+        self.pausedUntil = max(self.pausedUntil, time.monotonic() + seconds)
+        self.tokens = 0
+
+class RequestMetrics(object):
+    '''
+    Live counters for an AsyncRequests session.
+    '''
+    def __init__(self, window=60, maxLatencies=10000):
+        self.window = window
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.throttled = 0
+        self.queued = 0
+        self.inFlight = 0
+        self.latencies = deque(maxlen=maxLatencies)
+        self.completed = deque()
+
+    def record(self, latency):
+        now = time.monotonic()
+        self.latencies.append(latency)
+        self.completed.append(now)
+        while self.completed and self.completed[0] < now - self.window:
+            self.completed.popleft()
+
+    @property
+    def requestsPerSecond(self):
+        now = time.monotonic()
+        while self.completed and self.completed[0] < now - self.window:
+            self.completed.popleft()
+        if len(self.completed) < 2:
+            return 0.0
+        return len(self.completed) / max(now - self.completed[0], 1e-9)
+
+    def latency_quantile(self, q):
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'retries': self.retries,
+            'throttled': self.throttled,
+            'queued': self.queued,
+            'inFlight': self.inFlight,
+            'requestsPerSecond': self.requestsPerSecond,
+            'latencyP50': self.latency_quantile(0.5),
+            'latencyP99': self.latency_quantile(0.99),
+        }
+
 class AsyncRequests(object):
-    def __init__(self, rateLimit, timeout=10):
+    '''
+    aiohttp session with rate limiting, retries and metrics.
+
+    'rateLimit' is the sustained interval between requests in seconds. Failed requests, 429s and 5xx responses are retried
+    with exponential backoff and jitter; a 429 also pauses the whole limiter for any Retry-After period.
+    With a ResponseCache, cached responses are returned without touching the limiter or the network. An 'accept'
+    callback (json, status) -> bool limits which responses are cached and reused, so failed results get fetched again.
+
+    The aiohttp session is opened on first use, inside the running event loop, on the HttpPool's shared connector if
+    one is given (otherwise on its own pooled connector). Can be used as an async context manager.
+    '''
+    def __init__(self, rateLimit, timeout=10, burst=1, maxInFlight=None, backoff=0.5, maxBackoff=30, limiter=None, cache=None, pool=None):
         self.rateLimit = rateLimit
         self.timeout = timeout
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.cache = cache
+        self.pool = pool
 
-        self.session = aiohttp.ClientSession()
-        self.lastRequest = 0
+        self.limiter = limiter or RateLimiter(rate=1/rateLimit, burst=burst, maxInFlight=maxInFlight)
+        self.metrics = RequestMetrics()
+        self.session = None
 
-    async def rate_limiter(self):
-        now = time.monotonic()
-        sleep = max(self.rateLimit - now + self.lastRequest, 0)
-        self.lastRequest = now + sleep
-        return await asyncio.sleep(sleep)
+    def _open_session(self):
+        if self.session is None or self.session.closed:
+            if self.pool is not None:
+                self.session = aiohttp.ClientSession(connector=self.pool.connector, connector_owner=False)
+            else:
+                self.session = aiohttp.ClientSession(connector=HttpPool().connector)
+        return self.session
 
-    async def fetch_json(self, url, params={}, headers={}, retries=3):
-        await self.rate_limiter()
+    async def __aenter__(self):
+        self._open_session()
+        return self
 
-        try:
-            async with self.session.get(url, params=params, headers=headers, timeout=self.timeout) as resp:
-                r = await resp.json()
-                assert r is not None
-        except Exception:
-            if retries > 0:
-                r = await self.fetch_json(url, params, headers, retries-1)
-            else:
-                raise Exception
-        print('AsyncRequests: Fetch successful', resp.status, time.monotonic())
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def fetch_json(self, url, params={}, headers={}, retries=3, accept=None):
+        r, status = await self._get(url, params, headers, retries, allowNone=False, accept=accept)
         return r
 
-    async def fetch(self, url, params={}, headers={}, retries=3):
-        await self.rate_limiter()
+    async def fetch(self, url, params={}, headers={}, retries=3, accept=None):
+        return await self._get(url, params, headers, retries, accept=accept)
 
-        try:
-            # print(time.monotonic())
-            async with self.session.get(url, params=params, headers=headers, timeout=self.timeout) as resp:
-                r = await resp.json()
-                status = resp.status
-        except Exception:
-            if retries > 0:
-                return await self.fetch(url, params, headers, retries-1)
+    async def _get(self, url, params, headers, retries, allowNone=True, accept=None):
+        if self.cache is not None:
+            cached = self.cache.get(url, params)
+            if cached is not None and (allowNone or cached[0] is not None) and (accept is None or accept(*cached)):
+                count('http.cached')
+                return cached
+
+        self.metrics.requests += 1
+        attempt = 0
+        while True:
+            retryAfter = None
+            self.metrics.queued += 1
+            try:
+                await self.limiter.acquire()
+            finally:
+                self.metrics.queued -= 1
+            self.metrics.inFlight += 1
+            start = time.monotonic()
+            try:
+                async with self._open_session().get(url, params=params, headers=headers, timeout=self.timeout) as resp:
+                    status = resp.status
+                    if status == 429 or status >= 500:
+                        raise RetryableStatus(status, _retry_after(resp.headers.get('Retry-After')))
+                    r = await resp.json()
+                    assert allowNone or r is not None
+            except Exception as e:
+                if isinstance(e, RetryableStatus):
+                    retryAfter = e.retryAfter
+                    if e.status == 429:
+                        self.metrics.throttled += 1
+                        count('http.throttled')
+                        if retryAfter:
+                            self.limiter.pause(retryAfter)
+                if attempt >= retries:
+                    self.metrics.failures += 1
+                    count('http.failures')
+                    raise Exception('AsyncRequests: request failed after {} retries ({!r})'.format(retries, e)) from e
             else:
-                raise Exception
-        print('AsyncRequests: Fetch successful', resp.status, time.monotonic())
-        return r, status
-    
+                latency = time.monotonic() - start
+                self.metrics.successes += 1
+                self.metrics.record(latency)
+                count('http.requests')
+                observe('http.latency', latency)
+                if self.cache is not None and status < 400 and (accept is None or accept(r, status)):
+                    self.cache.set(url, params, r, status)
+                return r, status
+            finally:
+                self.metrics.inFlight -= 1
+                self.limiter.release()
+
+            delay = min(self.maxBackoff, self.backoff * 2**attempt) * random.uniform(0.5, 1)
+            attempt += 1
+            self.metrics.retries += 1
+            count('http.retries')
+            await asyncio.sleep(max(delay, retryAfter or 0))
+
+    def stats(self):
+        return self.metrics.to_dict()
+
     async def close(self):
-        await self.session.close()
\ No newline at end of file
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+class HttpPool(object):
+    '''
+    One pooled aiohttp TCPConnector (keep-alive, DNS caching, per-host connection limits) to share between the
+    AsyncRequests sessions of several API clients, e.g. a Rightmove and a JourneyPlanner collecting concurrently.
+    The connector is created on first use inside the running event loop, and again whenever a different loop uses the
+    pool. The sync wrappers close it at the end of each call; async code should 'async with pool:' (or await close())
+    before its loop ends, as a connector left open on a finished loop can only be released, not closed.
+    '''
+    def __init__(self, limit=100, limitPerHost=50, dnsCacheTtl=300, keepalive=30):
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.dnsCacheTtl = dnsCacheTtl
+        self.keepalive = keepalive
+        self._connector = None
+        self._loop = None
+
+    @property
+    def connector(self):
+        loop = asyncio.get_running_loop()
+        # a connector can't be used (or closed) from another loop: one left open on an old loop is just released
+        if self._connector is None or self._connector.closed or self._loop is not loop:
+            self._connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limitPerHost,
+                                                   ttl_dns_cache=self.dnsCacheTtl, keepalive_timeout=self.keepalive)
+            self._loop = loop
+        return self._connector
+
+    async def close(self):
+        if self._connector is not None:
+            if self._loop is asyncio.get_running_loop():
+                await self._connector.close()
+            self._connector = None
+            self._loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+class AsyncClient(object):
+    '''
+    Base for API clients with async methods. Inside 'async with client:' one AsyncRequests session is kept open and
+    shared by every call; otherwise each call opens and closes its own.
+    '''
+    def _new_requests(self):
+        return AsyncRequests(rateLimit=self.rateLimit, burst=self.burst, maxInFlight=self.maxInFlight, cache=self.cache, pool=self.pool)
+
+    @asynccontextmanager
+    async def _session(self):
+        if getattr(self, '_openRequests', None) is not None:
+            self.requests = self._openRequests
+            yield self.requests
+            return
+        self.requests = self._new_requests()
+        try:
+            yield self.requests
+        finally:
+            await self.requests.close()
+
+    async def __aenter__(self):
+        self._openRequests = self._new_requests()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._openRequests.close()
+        self._openRequests = None
+
+def run_sync(coroutine, pool=None):
+    '''
+    Runs a coroutine to completion for the sync wrappers of AsyncClient methods. Each run gets its own event loop, so a
+    shared HttpPool's connector is closed before that loop ends (the next run opens a new one).
+    '''
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            if pool is not None:
+                await pool.close()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(run())
+    coroutine.close()
+    raise Exception('Already inside a running event loop (e.g. Jupyter): await the "_async" method instead')
+
+def _retry_after(value):
+    '''
+    Parses a Retry-After header (seconds or an HTTP date) into seconds.
+    '''
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
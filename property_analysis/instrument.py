@@ -0,0 +1,234 @@
+import contextvars
+import cProfile
+import functools
+import inspect
+import logging
+import pstats
+import time
+import tracemalloc
+from collections import deque
+
+from .ndjson import dumps
+
+class Histogram(object):
+    '''
+    Count, total and a bounded sample of observed values, for quantiles.
+    '''
+    def __init__(self, maxSamples=10000):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=maxSamples)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        samples = sorted(self.samples)
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.total / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p99': self.quantile(0.99), 'max': max(self.samples) if self.samples else None}
+
+class Span(object):
+    '''
+    Times one named stage of the pipeline; use through Instrumentation.span().
+    '''
+    def __init__(self, instrumentation, name, fields):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.fields = fields
+        self.start = None
+        self.wallStart = None
+        self.duration = None
+        self._profiler = None
+        self._tracing = False
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def __enter__(self):
+        inst = self.instrumentation
+        self._outerDepth = inst._depth.get()
+        outermost = self._outerDepth == 0
+        inst._depth.set(self._outerDepth + 1)
+        if outermost and inst.traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        if outermost and inst.profile and inst._profiler is None:
+            # one profiler per thread: a concurrent outermost span (another task) runs inside this one's profile
+            self._profiler = inst._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self.wallStart = time.time()
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        self.duration = time.monotonic() - self.start
+        inst = self.instrumentation
+        inst._depth.set(self._outerDepth)
+        event = {'type': 'span', 'name': self.name, 'start': self.wallStart, 'duration': self.duration, **self.fields}
+        if excType is not None:
+            event['error'] = repr(exc)
+        if self._profiler is not None:
+            self._profiler.disable()
+            inst._profiler = None
+            stats = pstats.Stats(self._profiler)
+            inst.profiles[self.name] = stats
+            event['profile'] = _top_functions(stats, inst.profileTop)
+        if self._tracing:
+            event['memoryPeak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        inst.spans.setdefault(self.name, Histogram()).observe(self.duration)
+        inst.emit(event)
+        return False
+
+class Instrumentation(object):
+    '''
+    Named spans (timed stages), counters and histograms for the pipeline, reported to pluggable sinks.
+
+    Counters and histograms are aggregated in memory and only sent to the sinks by report(); span events are sent when
+    each span ends. With 'profile' / 'traceMemory' each outermost span is run under cProfile / tracemalloc and its top
+    functions / peak memory are added to its event (and the cProfile stats kept in self.profiles). Nesting is tracked
+    per asyncio task, so concurrent tasks (e.g. a Rightmove search and TfL requests on one loop) each have outermost spans.
+    '''
+    def __init__(self, sinks=(), profile=False, traceMemory=False, profileTop=15):
+        self.sinks = list(sinks)
+        self.profile = profile
+        self.traceMemory = traceMemory
+        self.profileTop = profileTop
+        self.counters = {}
+        self.histograms = {}
+        self.spans = {}
+        self.profiles = {}
+        self._depth = contextvars.ContextVar('spanDepth', default=0)
+        self._profiler = None
+
+    def span(self, name, **fields):
+        return Span(self, name, fields)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink(event)
+
+    def summary(self):
+        return {
+            'counters': dict(self.counters),
+            'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            'spans': {name: histogram.to_dict() for name, histogram in self.spans.items()},
+        }
+
+    def report(self):
+        '''
+        Sends the counters, histograms and span timings so far to the sinks, and returns them.
+        '''
+        summary = self.summary()
+        self.emit({'type': 'summary', 'time': time.time(), **summary})
+        return summary
+
+    def reset(self):
+        self.counters, self.histograms, self.spans, self.profiles = {}, {}, {}, {}
+
+class MemorySink(object):
+    '''
+    Keeps every event in a list, e.g. for tests.
+    '''
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def spans(self, name=None):
+        return [event for event in self.events if event['type'] == 'span' and (name is None or event['name'] == name)]
+
+class JsonLinesSink(object):
+    '''
+    Appends every event as one line of JSON to 'path'.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+
+    def __call__(self, event):
+        self._file.write(dumps(event) + b'\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class LoggingSink(object):
+    '''
+    Logs every event through the 'property_analysis' logger (or 'logger').
+    '''
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('property_analysis')
+        self.level = level
+
+    def __call__(self, event):
+        if event['type'] == 'span':
+            self.logger.log(self.level, '%s took %.3f secs', event['name'], event['duration'])
+        else:
+            self.logger.log(self.level, '%s', event)
+
+_instrumentation = Instrumentation()
+
+def get_instrumentation():
+    return _instrumentation
+
+def set_instrumentation(instrumentation):
+    '''
+    Replaces the package-wide Instrumentation (by default one with no sinks) and returns the previous one.
+    '''
+    global _instrumentation
+    previous, _instrumentation = _instrumentation, instrumentation
+    return previous
+
+def span(name, **fields):
+    return _instrumentation.span(name, **fields)
+
+def count(name, value=1):
+    _instrumentation.count(name, value)
+
+def observe(name, value):
+    _instrumentation.observe(name, value)
+
+def timed(name):
+    '''
+    Decorator running a function (or coroutine function) inside span(name).
+    '''
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _top_functions(stats, top):
+    stats.sort_stats('cumulative')
+    rows = []
+    for func in stats.fcn_list[:top]:
+        primitiveCalls, calls, totalTime, cumulativeTime, _ = stats.stats[func]
+        rows.append({'function': pstats.func_std_string(func), 'calls': calls, 'tottime': round(totalTime, 6), 'cumtime': round(cumulativeTime, 6)})
+    return rows
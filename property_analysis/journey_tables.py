@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+class JourneyTables(object):
+    '''
+    Typed tables extracted from raw TfL results in a single pass:
+
+    'postcodes': one row per postcode with the quickest journey time, indexed by postcode.
+    'journeys': one row per journey option ('duration', number of 'legs'), indexed by (postcode, journeyIdx).
+    'legs': one row per leg ('mode', 'duration'), indexed by (postcode, journeyIdx, legIdx).
+    '''
+    def __init__(self, postcodes, journeys, legs):
+        self.postcodes = postcodes
+        self.journeys = journeys
+        self.legs = legs
+
+    @classmethod
+    def from_results(cls, results):
+        postcodes, froms, tos, dateTimes, dateTimeTypes, journeyTimes = [], [], [], [], [], []
+        journeyPostcode, journeyIdxs, journeyDurations, journeyLegs = [], [], [], []
+        legJourney, legIdxs, legModes, legDurations = [], [], [], []
+
+        for postcode, result in results.items():
+            p = len(postcodes)
+            postcodes.append(postcode)
+            froms.append(result['journeyVector']['from'])
+            tos.append(result['journeyVector']['to'])
+            dateTimes.append(result['searchCriteria']['dateTime'])
+            dateTimeTypes.append(result['searchCriteria']['dateTimeType'])
+            quickest = None
+            for journeyIdx, journey in enumerate(result['journeys']):
+                j = len(journeyIdxs)
+                duration = journey['duration']
+                if quickest is None or duration < quickest:
+                    quickest = duration
+                journeyPostcode.append(p)
+                journeyIdxs.append(journeyIdx)
+                journeyDurations.append(duration)
+                journeyLegs.append(len(journey['legs']))
+                for legIdx, leg in enumerate(journey['legs']):
+                    legJourney.append(j)
+                    legIdxs.append(legIdx)
+                    legModes.append(leg['mode']['name'])
+                    legDurations.append(leg['duration'])
+            journeyTimes.append(np.nan if quickest is None else quickest)
+
+        postcodeIndex = pd.Index(postcodes, dtype=object, name='postcode')
+        to = pd.Categorical(tos)
+        dateTime = pd.Categorical(dateTimes)
+        dateTimeType = pd.Categorical(dateTimeTypes)
+
+        postcodesDf = pd.DataFrame({'from': froms, 'to': to, 'dateTime': dateTime, 'journeyTime': _int_if_complete(journeyTimes)}, index=postcodeIndex)
+
+        # indexes are built from codes into the (unique) postcodes, which avoids factorizing every row again
+        journeyPostcode = np.asarray(journeyPostcode, dtype=np.int64)
+        journeyIdxs = np.asarray(journeyIdxs, dtype=np.int64)
+        journeyIndex = pd.MultiIndex(levels=[postcodeIndex, _positions(journeyIdxs)], codes=[journeyPostcode, journeyIdxs],
+                                     names=['postcode', 'journeyIdx'], verify_integrity=False)
+        journeysDf = pd.DataFrame({
+            'from': np.asarray(froms, dtype=object)[journeyPostcode],
+            'to': to.take(journeyPostcode),
+            'dateTime': dateTime.take(journeyPostcode),
+            'dateTimeType': dateTimeType.take(journeyPostcode),
+            'duration': np.asarray(journeyDurations, dtype=np.int32),
+            'legs': np.asarray(journeyLegs, dtype=np.int32),
+        }, index=journeyIndex)
+
+        legJourney = np.asarray(legJourney, dtype=np.int64)
+        legIdxs = np.asarray(legIdxs, dtype=np.int64)
+        legIndex = pd.MultiIndex(levels=[postcodeIndex, _positions(journeyIdxs), _positions(legIdxs)],
+                                 codes=[journeyPostcode[legJourney], journeyIdxs[legJourney], legIdxs],
+                                 names=['postcode', 'journeyIdx', 'legIdx'], verify_integrity=False)
+        legsDf = pd.DataFrame({'mode': pd.Categorical(legModes), 'duration': np.asarray(legDurations, dtype=np.int32)}, index=legIndex)
+
+        return cls(postcodesDf, journeysDf, legsDf)
+
+def _positions(idxs):
+    return np.arange(idxs.max() + 1 if len(idxs) else 0)
+
+def _int_if_complete(values):
+    values = np.asarray(values, dtype=np.float64)
+    return values.astype(np.int64) if not np.isnan(values).any() else values
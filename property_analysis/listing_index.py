@@ -0,0 +1,90 @@
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+import pandas as pd
+
+class ListingIndex(object):
+    '''
+    SQLite index of every Rightmove listing seen so far, keyed by search and 'identifier', plus a price change history.
+
+    Lets incremental searches stop paging once they reach listings they have already seen, and turns each run into
+    deltas (new listings, price changes, removals) instead of full snapshots.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS listings (
+                search TEXT, identifier INTEGER, location TEXT, price REAL, firstSeen TEXT, lastSeen TEXT, removed TEXT,
+                PRIMARY KEY (search, identifier));
+            CREATE TABLE IF NOT EXISTS priceChanges (search TEXT, identifier INTEGER, date TEXT, oldPrice REAL, newPrice REAL);
+            CREATE INDEX IF NOT EXISTS priceChanges_identifier ON priceChanges (identifier);''')
+        self.conn.commit()
+
+    @staticmethod
+    def search_key(propType, params):
+        '''
+        Identifies a search by its type and filters, ignoring paging, location and sort order.
+        '''
+        filters = sorted((k, str(v)) for k, v in params.items() if k not in ('index', 'locationIdentifier', 'sortType'))
+        return hashlib.sha1(json.dumps([propType, filters]).encode()).hexdigest()[:16]
+
+    def known_identifiers(self, search):
+        '''
+        Returns the identifiers of listings for this search that haven't been removed.
+        '''
+        rows = self.conn.execute('SELECT identifier FROM listings WHERE search = ? AND removed IS NULL', (search,))
+        return {identifier for identifier, in rows}
+
+    def update(self, df, search, fullLocations=(), date=None):
+        '''
+        Records the listings in 'df' (needs 'identifier', 'location' and 'price' columns) and returns the deltas as
+        {'new', 'priceChanges', 'removed'} DataFrames.
+
+        Removals can only be detected for 'fullLocations', the locations whose results were paged all the way through.
+        '''
+        date = date or datetime.now().isoformat(timespec='seconds')
+        fetched = df.reindex(columns=['identifier', 'location', 'price']).drop_duplicates('identifier', keep='last')  # df may be empty
+        fetched = fetched.astype({'identifier': 'int64', 'price': 'float64'})
+        existing = pd.read_sql_query('SELECT identifier, location AS oldLocation, price AS oldPrice, removed FROM listings WHERE search = ?', self.conn, params=(search,))
+
+        merged = fetched.merge(existing, on='identifier', how='left', indicator=True)
+        new = merged[(merged['_merge'] == 'left_only') | merged['removed'].notna()]
+        changed = merged[(merged['_merge'] == 'both') & merged['removed'].isna() & (merged['price'] != merged['oldPrice']) & merged['price'].notna()]
+
+        current = existing[existing['removed'].isna() & existing['oldLocation'].isin(list(fullLocations))]
+        removed = current[~current['identifier'].isin(fetched['identifier'])]
+
+        self.conn.executemany(
+            '''INSERT INTO listings VALUES (?, ?, ?, ?, ?, ?, NULL)
+            ON CONFLICT (search, identifier) DO UPDATE SET location = excluded.location, price = excluded.price, lastSeen = excluded.lastSeen, removed = NULL''',
+            [(search, int(identifier), location, _nullable(price), date, date) for identifier, location, price in fetched.itertuples(index=False)])
+        self.conn.executemany('INSERT INTO priceChanges VALUES (?, ?, ?, ?, ?)',
+            [(search, int(identifier), date, _nullable(old), _nullable(price)) for identifier, price, old in changed[['identifier', 'price', 'oldPrice']].itertuples(index=False)])
+        self.conn.executemany('UPDATE listings SET removed = ? WHERE search = ? AND identifier = ?',
+            [(date, search, int(identifier)) for identifier in removed['identifier']])
+        self.conn.commit()
+
+        return {
+            'new': new[['identifier', 'location', 'price']].reset_index(drop=True),
+            'priceChanges': changed[['identifier', 'location', 'oldPrice', 'price']].rename(columns={'price': 'newPrice'}).reset_index(drop=True),
+            'removed': removed[['identifier', 'oldLocation', 'oldPrice']].rename(columns={'oldLocation': 'location', 'oldPrice': 'price'}).reset_index(drop=True),
+        }
+
+    def price_history(self, search=None, identifier=None):
+        query = 'SELECT * FROM priceChanges WHERE 1=1'
+        params = []
+        if search is not None:
+            query += ' AND search = ?'
+            params.append(search)
+        if identifier is not None:
+            query += ' AND identifier = ?'
+            params.append(int(identifier))
+        return pd.read_sql_query(query + ' ORDER BY identifier, date', self.conn, params=params)
+
+    def close(self):
+        self.conn.close()
+
+def _nullable(value):
+    return None if value is None or value != value else float(value)
@@ -0,0 +1,334 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+class ListingQuery(object):
+    '''
+    Indexes over a listings DataFrame (Rightmove.get_df, Postcodes.get_df, ...) for answering many filters quickly.
+
+    Numeric columns get a sorted index, text/categorical columns (e.g. 'postcodeSector') an index of rows per value and
+    the lat/long columns a grid index for bounding boxes. Indexes are built on first use, or up front for 'index'.
+    Filters (Between, IsIn, Within, combined with &, | and ~) are evaluated by taking the rows of the most selective
+    indexed filter and checking the rest on just those rows; results are kept in an LRU cache of 'cacheSize' queries.
+
+    The frame is treated as read-only: build a new ListingQuery after changing it.
+    '''
+    def __init__(self, df, index=(), latCol='latitude', lngCol='longitude', cellSize=0.01, cacheSize=1024):
+        self.df = df
+        self.latCol = latCol
+        self.lngCol = lngCol
+        self.cellSize = cellSize
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._indexes = {}
+        self._grid = None
+        self._all = np.arange(len(df))
+        self._all.flags.writeable = False
+        for column in index:
+            self.column_index(column)
+
+    def __len__(self):
+        return len(self.df)
+
+    def column_index(self, column):
+        '''
+        Returns the SortedIndex or ValueIndex for 'column', building it the first time.
+        '''
+        if column not in self._indexes:
+            if column not in self.df.columns:
+                raise Exception('ListingQuery: no column {}'.format(column))
+            values = self.df[column]
+            if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                self._indexes[column] = SortedIndex(values)
+            else:
+                self._indexes[column] = ValueIndex(values)
+        return self._indexes[column]
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            self._grid = GridIndex(self.df[self.latCol], self.df[self.lngCol], self.cellSize)
+        return self._grid
+
+    def positions(self, query=None):
+        '''
+        Sorted (read-only) row positions matching 'query'; all rows for None.
+        '''
+        if query is None:
+            return self._all
+        key = query.key
+        positions = self.cache.get(key)
+        if positions is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return positions
+        self.misses += 1
+        positions = query._positions(self)
+        positions.flags.writeable = False
+        self.cache[key] = positions
+        if len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+        return positions
+
+    def count(self, query=None):
+        return len(self.positions(query))
+
+    def query(self, query=None, columns=None, orderBy=None, ascending=True, limit=None):
+        '''
+        Returns the matching rows as a DataFrame, optionally only 'columns', sorted by the 'orderBy' column (using its
+        index; missing values last) and cut to 'limit' rows.
+        '''
+        positions = self.positions(query)
+        if orderBy is not None:
+            index = self.column_index(orderBy)
+            ranks = index.ranks[positions]
+            if not ascending:
+                ranks = np.where(ranks >= index.missingRank, np.iinfo(np.int64).max, -ranks)
+            positions = positions[np.argsort(ranks, kind='stable')]
+        if limit is not None:
+            positions = positions[:limit]
+        df = self.df if columns is None else self.df[columns]
+        return df.iloc[positions]
+
+    def clear_cache(self):
+        self.cache.clear()
+
+class SortedIndex(object):
+    '''
+    Row positions of a numeric column sorted by value (missing values last), for range lookups by binary search.
+    '''
+    def __init__(self, values):
+        self.values = pd.Series(values).to_numpy(dtype=np.float64, na_value=np.nan)
+        self.order = np.argsort(self.values, kind='stable')
+        self.sorted = self.values[self.order]
+        self.ranks = np.empty(len(self.order), dtype=np.int64)
+        self.ranks[self.order] = np.arange(len(self.order))
+        self.known = int(np.isfinite(self.sorted).sum()) if len(self.sorted) else 0
+        self.missingRank = self.known
+
+    def bounds(self, lo, hi):
+        start = 0 if lo is None else np.searchsorted(self.sorted[:self.known], lo, side='left')
+        stop = self.known if hi is None else np.searchsorted(self.sorted[:self.known], hi, side='right')
+        return start, max(start, stop)
+
+class ValueIndex(object):
+    '''
+    Row positions of a column grouped by value, so the rows for any value are one contiguous slice.
+    '''
+    def __init__(self, values):
+        self.codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        self.codeOf = {value: code for code, value in enumerate(uniques)}
+        self.order = np.argsort(self.codes, kind='stable')
+        sortedCodes = self.codes[self.order]
+        self.starts = np.searchsorted(sortedCodes, np.arange(len(uniques) + 1))
+        # rank by value for orderBy (NaN last)
+        valueRanks = np.argsort(np.argsort(np.asarray(uniques, dtype=object).astype(str), kind='stable'))
+        self.ranks = np.where(self.codes >= 0, np.append(valueRanks, 0)[self.codes], len(uniques))
+        self.missingRank = len(uniques)
+
+    def value_codes(self, values):
+        return np.array([self.codeOf[value] for value in values if value in self.codeOf], dtype=np.int64)
+
+class GridIndex(object):
+    '''
+    Row positions bucketed into 'cellSize' degree lat/long cells, sorted by cell, for bounding-box lookups.
+    '''
+    def __init__(self, lats, lngs, cellSize):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.cellSize = cellSize
+        known = np.isfinite(self.lats) & np.isfinite(self.lngs)
+        cy, cx = self._cells(self.lats, self.lngs, known)
+        if known.any():
+            self.cyMin, self.cxMin = cy[known].min(), cx[known].min()
+            self.ny, self.nx = cy[known].max() - self.cyMin + 1, cx[known].max() - self.cxMin + 1
+        else:
+            self.cyMin = self.cxMin = 0
+            self.ny = self.nx = 0
+        keys = np.where(known, (cy - self.cyMin) * self.nx + (cx - self.cxMin), -1)
+        self.order = np.argsort(keys, kind='stable')
+        self.sortedKeys = keys[self.order]
+
+    def _cells(self, lats, lngs, known=True):
+        cy = np.floor(np.where(known, lats, 0) / self.cellSize).astype(np.int64)
+        cx = np.floor(np.where(known, lngs, 0) / self.cellSize).astype(np.int64)
+        return cy, cx
+
+    def ranges(self, south, west, north, east):
+        '''
+        (starts, stops) into self.order covering every cell that overlaps the box, one range per row of cells.
+        '''
+        if not self.ny:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        (cy0, cy1), (cx0, cx1) = self._cells(np.array([south, north]), np.array([west, east]))
+        cy0, cy1 = max(cy0 - self.cyMin, 0), min(cy1 - self.cyMin, self.ny - 1)
+        cx0, cx1 = max(cx0 - self.cxMin, 0), min(cx1 - self.cxMin, self.nx - 1)
+        if cy0 > cy1 or cx0 > cx1:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        rows = np.arange(cy0, cy1 + 1) * self.nx
+        return np.searchsorted(self.sortedKeys, rows + cx0, side='left'), np.searchsorted(self.sortedKeys, rows + cx1, side='right')
+
+class Filter(object):
+    '''
+    Base for composable filters; combine with & (all), | (any) and ~ (not).
+    '''
+    def __and__(self, other):
+        return All(self, other)
+
+    def __or__(self, other):
+        return Any(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def __repr__(self):
+        return '{}{}'.format(type(self).__name__, self.key[1:])
+
+    def _estimate(self, engine):
+        '''
+        Upper bound on the matching rows, without materializing them.
+        '''
+        return len(engine)
+
+    def _positions(self, engine):
+        '''
+        Sorted positions of the matching rows.
+        '''
+        return np.flatnonzero(self._test(engine, engine._all))
+
+    def _test(self, engine, positions):
+        '''
+        Boolean mask of which of 'positions' match.
+        '''
+        raise NotImplementedError
+
+class Between(Filter):
+    '''
+    Rows with lo <= column <= hi (either bound can be None); rows missing the value never match.
+    '''
+    def __init__(self, column, lo=None, hi=None):
+        self.column = column
+        self.lo = lo
+        self.hi = hi
+        self.key = ('between', column, lo, hi)
+
+    def _estimate(self, engine):
+        start, stop = engine.column_index(self.column).bounds(self.lo, self.hi)
+        return stop - start
+
+    def _positions(self, engine):
+        index = engine.column_index(self.column)
+        start, stop = index.bounds(self.lo, self.hi)
+        return np.sort(index.order[start:stop])
+
+    def _test(self, engine, positions):
+        values = engine.column_index(self.column).values[positions]
+        mask = np.isfinite(values)
+        if self.lo is not None:
+            mask &= values >= self.lo
+        if self.hi is not None:
+            mask &= values <= self.hi
+        return mask
+
+class IsIn(Filter):
+    '''
+    Rows whose column is one of 'values' (a single value is allowed), e.g. IsIn('postcodeSector', ['E1 6', 'E1 7']).
+    '''
+    def __init__(self, column, values):
+        if isinstance(values, (str, bytes)) or not np.iterable(values):
+            values = [values]
+        self.column = column
+        self.values = tuple(values)
+        self.key = ('isin', column, self.values)
+
+    def _estimate(self, engine):
+        index = engine.column_index(self.column)
+        codes = index.value_codes(self.values)
+        return int((index.starts[codes + 1] - index.starts[codes]).sum())
+
+    def _positions(self, engine):
+        index = engine.column_index(self.column)
+        slices = [index.order[index.starts[code]:index.starts[code + 1]] for code in index.value_codes(self.values)]
+        return np.sort(np.concatenate(slices + [np.zeros(0, dtype=np.int64)]))
+
+    def _test(self, engine, positions):
+        index = engine.column_index(self.column)
+        return np.isin(index.codes[positions], index.value_codes(self.values))
+
+class Within(Filter):
+    '''
+    Rows whose lat/long is inside the box (inclusive), e.g. Within(51, -0.75, 52, 0.75) for the general London area.
+    '''
+    def __init__(self, south, west, north, east):
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.key = ('within', south, west, north, east)
+
+    def _estimate(self, engine):
+        starts, stops = engine.grid.ranges(self.south, self.west, self.north, self.east)
+        return int((stops - starts).sum())
+
+    def _positions(self, engine):
+        grid = engine.grid
+        starts, stops = grid.ranges(self.south, self.west, self.north, self.east)
+        candidates = np.concatenate([grid.order[start:stop] for start, stop in zip(starts, stops)] + [np.zeros(0, dtype=np.int64)])
+        return np.sort(candidates[self._test(engine, candidates)])
+
+    def _test(self, engine, positions):
+        lats, lngs = engine.grid.lats[positions], engine.grid.lngs[positions]
+        return (lats >= self.south) & (lats <= self.north) & (lngs >= self.west) & (lngs <= self.east)
+
+class All(Filter):
+    def __init__(self, *filters):
+        self.filters = [part for f in filters for part in (f.filters if isinstance(f, All) else [f])]
+        self.key = ('all',) + tuple(f.key for f in self.filters)
+
+    def _estimate(self, engine):
+        return min(f._estimate(engine) for f in self.filters)
+
+    def _positions(self, engine):
+        # start from the most selective filter and check the others on its rows only
+        filters = sorted(self.filters, key=lambda f: f._estimate(engine))
+        positions = filters[0]._positions(engine)
+        for f in filters[1:]:
+            if not len(positions):
+                break
+            positions = positions[f._test(engine, positions)]
+        return positions
+
+    def _test(self, engine, positions):
+        mask = np.ones(len(positions), dtype=bool)
+        for f in self.filters:
+            mask[mask] = f._test(engine, positions[mask])
+        return mask
+
+class Any(Filter):
+    def __init__(self, *filters):
+        self.filters = [part for f in filters for part in (f.filters if isinstance(f, Any) else [f])]
+        self.key = ('any',) + tuple(f.key for f in self.filters)
+
+    def _estimate(self, engine):
+        return min(len(engine), sum(f._estimate(engine) for f in self.filters))
+
+    def _positions(self, engine):
+        return np.unique(np.concatenate([f._positions(engine) for f in self.filters]))
+
+    def _test(self, engine, positions):
+        mask = np.zeros(len(positions), dtype=bool)
+        for f in self.filters:
+            mask[~mask] = f._test(engine, positions[~mask])
+        return mask
+
+class Not(Filter):
+    def __init__(self, filter):
+        self.filter = filter
+        self.key = ('not', filter.key)
+
+    def _positions(self, engine):
+        mask = np.ones(len(engine), dtype=bool)
+        mask[self.filter._positions(engine)] = False
+        return np.flatnonzero(mask)
+
+    def _test(self, engine, positions):
+        return ~self.filter._test(engine, positions)
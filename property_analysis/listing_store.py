@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+class ListingStore(object):
+    '''
+    Columnar store of Rightmove listings, replacing the nested {location: {'info', 'properties': [dict, ...]}} results.
+
+    Fetched pages are appended as DataFrame chunks and concatenated once, the first time the frame is needed.
+    Per-location search info is kept separately in 'info'. To give back the raw property dicts, the keys each property
+    came with (by identifier) and the columns whose raw values were all ints are remembered too.
+    '''
+    def __init__(self):
+        self.info = {}
+        self._chunks = []
+        self._df = pd.DataFrame()
+        self._keySets = {}  # frozenset of raw keys: itself, so each distinct key set is stored once
+        self._keysOf = {}  # identifier: frozenset of its raw keys
+        self._intColumns = set()
+        self._nonIntColumns = set()
+
+    def append(self, location, properties):
+        '''
+        Appends one page of raw property dicts for 'location'.
+        '''
+        if not properties:
+            return
+        for prop in properties:
+            keys = frozenset(prop)
+            keys = self._keySets.setdefault(keys, keys)
+            if 'identifier' in prop:
+                self._keysOf[prop['identifier']] = keys
+            for key, value in prop.items():
+                if value is None:
+                    continue
+                if isinstance(value, int) and not isinstance(value, bool):
+                    self._intColumns.add(key)
+                else:
+                    self._nonIntColumns.add(key)
+        chunk = pd.DataFrame.from_records(properties)
+        chunk['location'] = location
+        self._chunks.append(chunk)
+
+    @property
+    def df(self):
+        if self._chunks:
+            frames = [self._df] if len(self._df) else []
+            self._df = pd.concat(frames + self._chunks, ignore_index=True, sort=False)
+            self._chunks = []
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._chunks = []
+        self._df = df
+
+    def __len__(self):
+        return len(self._df) + sum(len(chunk) for chunk in self._chunks)
+
+    @property
+    def locations(self):
+        return list(self.info.keys())
+
+    def to_results(self):
+        '''
+        Returns the old nested results dict (see iter_properties for the property dicts).
+        '''
+        results = {location: {'info': info, 'properties': []} for location, info in self.info.items()}
+        for prop in self.iter_properties():
+            results.setdefault(prop.get('location'), {'info': {}, 'properties': []})['properties'].append(prop)
+        return results
+
+    def iter_properties(self, chunkSize=5000):
+        '''
+        Yields every listing as a property dict, converting 'chunkSize' rows at a time from the stored frames. Keys a
+        property was fetched without are left out, other missing values are written as None, and columns that only ever
+        held ints (before NaN gaps made them floats) are ints again.
+        '''
+        rawKeys = frozenset().union(*self._keySets)
+        intColumns = self._intColumns - self._nonIntColumns
+        frames = ([self._df] if len(self._df) else []) + self._chunks
+        for frame in frames:
+            for start in range(0, len(frame), chunkSize):
+                for record in frame.iloc[start:start + chunkSize].to_dict('records'):
+                    keys = self._keysOf.get(record.get('identifier'))
+                    yield {k: _to_builtin(v, k in intColumns) for k, v in record.items()
+                           if keys is None or k in keys or k not in rawKeys}
+
+    @classmethod
+    def from_results(cls, results):
+        store = cls()
+        for location, resultDict in results.items():
+            store.info[location] = resultDict.get('info', {})
+            store.append(location, resultDict.get('properties', []))
+        return store
+
+def _is_missing(value):
+    return value is None or value is pd.NA or (isinstance(value, float) and value != value)
+
+def _to_builtin(value, isInt=False):
+    if _is_missing(value):
+        return None
+    value = value.item() if isinstance(value, np.generic) else value
+    if isInt and isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
@@ -0,0 +1,95 @@
+import gzip
+import json
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl', '.ndjson.gz', '.jsonl.gz')
+
+def is_ndjson(path):
+    return str(path).endswith(NDJSON_EXTENSIONS)
+
+def dumps(obj):
+    '''
+    Serializes to one line of JSON bytes, with orjson if it's installed.
+    '''
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def loads(line):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+def _open(path, mode):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode, compresslevel=6)
+    return open(path, mode)
+
+class NdjsonWriter(object):
+    '''
+    Writes records (one JSON object per line) to a .ndjson/.jsonl file, gzipped if the path ends in '.gz', buffering
+    'batchSize' records (or 'flushInterval' seconds) between writes so results can be written as they arrive.
+
+    Has the same write(rows) / flush() / close() interface as tfl.RowWriter.
+    '''
+    def __init__(self, path, batchSize=1000, flushInterval=None, append=False):
+        self.path = path
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.lines = []
+        self.written = 0
+        self.lastFlush = time.monotonic()
+        self._file = _open(path, 'ab' if append else 'wb')
+
+    def write(self, records):
+        for record in records:
+            self.lines.append(dumps(record))
+            if len(self.lines) >= self.batchSize:
+                self.flush()
+        if self.flushInterval is not None and time.monotonic() - self.lastFlush >= self.flushInterval:
+            self.flush()
+
+    def flush(self):
+        self.lastFlush = time.monotonic()
+        if self.lines:
+            self._file.write(b'\n'.join(self.lines) + b'\n')
+            self.written += len(self.lines)
+            self.lines = []
+            self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_ndjson(path):
+    '''
+    Yields the records of a .ndjson/.jsonl(.gz) file one at a time.
+    '''
+    with _open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+def read_ndjson_chunks(path, chunkSize=1000):
+    '''
+    Yields the records of a .ndjson/.jsonl(.gz) file in lists of up to 'chunkSize'.
+    '''
+    chunk = []
+    for record in read_ndjson(path):
+        chunk.append(record)
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,128 @@
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+from .postcode_store import LatLongView, PostcodeStore
+
+class SharedArrays(object):
+    '''
+    NumPy arrays copied once into shared memory blocks, so worker processes can attach to them by name instead of
+    receiving a pickled copy.
+    '''
+    def __init__(self, arrays):
+        self.blocks = []
+        self.arrays = {}
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+            self.blocks.append(block)
+            self.arrays[name] = shared
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    @staticmethod
+    def attach(spec):
+        '''
+        Returns ({name: array}, blocks) for a 'spec' made in another process; close the blocks when done.
+        '''
+        arrays, blocks = {}, []
+        for name, (blockName, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=blockName)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            blocks.append(block)
+        return arrays, blocks
+
+    def close(self):
+        self.arrays = {}
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+def shard_locations(counts, shards):
+    '''
+    Splits locations into at most 'shards' groups of roughly equal listing counts, deterministically (largest first,
+    each to the currently smallest shard, ties to the lowest shard).
+    '''
+    groups = [[] for _ in range(max(1, min(shards, len(counts))))]
+    sizes = [0] * len(groups)
+    for location, count in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+        i = sizes.index(min(sizes))
+        groups[i].append(location)
+        sizes[i] += count
+    return [sorted(group) for group in groups if group]
+
+def postprocess_sharded(rightmove, latlongDict, journeyTimes=(), propType=None, toDrop=(), sectorFallback=False, workers=None, shardsPerWorker=4):
+    '''
+    Runs estimate_postcodes and add_journey_times (and _clean_results, given 'propType') for 'rightmove' across a process
+    pool, one shard of outcodes per task, and returns the listings merged back in their original order. Workers only
+    read their outcodes' slice of the postcode arrays, from shared memory.
+    '''
+    store = _postcode_store(latlongDict)
+    df = rightmove.listings.df
+    df = df.assign(_row=np.arange(len(df)))
+    counts = df['location'].value_counts().to_dict()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        shards = shard_locations(counts, (workers or os.cpu_count() or 1) * shardsPerWorker)
+        shared = SharedArrays({'postcodes': store.postcodes, 'lats': store.lats, 'lngs': store.lngs})
+        try:
+            series = []
+            for source, name in journeyTimes:
+                s = rightmove._journey_series(source)
+                series.append((s, s.index.str.split(' ', n=1).str[0], name))
+            searched = set(rightmove.outcodes)
+            futures = []
+            for locations in shards:
+                outcodes = [location for location in locations if location in searched]
+                slices = [_slice_bounds(store.outcode_slice(outcode)) for outcode in outcodes]
+                shardSeries = [(s[outcodeOf.isin(outcodes)], name) for s, outcodeOf, name in series]
+                futures.append(pool.submit(_postprocess_shard, df[df['location'].isin(locations)], outcodes, shared.spec, slices,
+                                           propType, list(toDrop), shardSeries, sectorFallback))
+            results = [future.result() for future in futures]
+        finally:
+            shared.close()
+
+    frames = [frame for frame in results if len(frame)]
+    merged = pd.concat(frames, sort=False) if frames else df.iloc[:0]
+    # a shard with no postcodes found has all-None object columns, which would otherwise widen the others' dtypes
+    return merged.infer_objects().sort_values('_row', kind='stable').drop(columns='_row').reset_index(drop=True)
+
+def _postprocess_shard(df, outcodes, spec, slices, propType, toDrop, journeyTimes, sectorFallback):
+    from .rightmove import Rightmove
+
+    arrays, blocks = SharedArrays.attach(spec)
+    try:
+        positions = np.concatenate([np.arange(start, stop) for start, stop in slices] + [np.array([], dtype=np.int64)])
+        store = PostcodeStore(arrays['postcodes'][positions], arrays['lats'][positions], arrays['lngs'][positions])
+        del arrays
+        rightmove = Rightmove._from_listings(outcodes, df.reset_index(drop=True))
+        with contextlib.redirect_stdout(io.StringIO()):
+            if propType is not None:
+                rightmove._clean_results(propType, toDrop)
+            rightmove.estimate_postcodes(store.latlongs)
+            if journeyTimes and len(rightmove.listings.df):
+                rightmove.add_journey_times(list(journeyTimes), sectorFallback=sectorFallback)
+        return rightmove.listings.df
+    finally:
+        for block in blocks:
+            block.close()
+
+def _postcode_store(latlongDict):
+    if isinstance(latlongDict, LatLongView):
+        return latlongDict.store
+    if isinstance(latlongDict, PostcodeStore):
+        return latlongDict
+    # old dicts: either postcode -> (lat, long) or (lat, long) -> [postcodes]
+    items = [(postcode, latlong) for latlong, postcodes in latlongDict.items() for postcode in postcodes] if latlongDict and isinstance(next(iter(latlongDict)), tuple) else list(latlongDict.items())
+    postcodes = [postcode for postcode, _ in items]
+    latlongs = np.array([latlong for _, latlong in items], dtype=np.float64).reshape(-1, 2)
+    return PostcodeStore(postcodes, latlongs[:, 0], latlongs[:, 1])
+
+def _slice_bounds(s):
+    return (s.start or 0, s.stop or 0)
@@ -0,0 +1,234 @@
+from collections.abc import ItemsView, Mapping, ValuesView
+import numpy as np
+
+
+class PostcodeStore(Mapping):
+    '''
+    Read-only postcode -> (lat, long) mapping backed by sorted NumPy arrays.
+
+    Drop-in replacement for the old 'postcodeDict', using a few bytes per postcode instead of a dict entry, a str and a tuple
+    of floats. Lookups are a binary search, and because postcodes are sorted each outcode is a contiguous slice.
+    Single lookups are slower than a dict's, so callers with many postcodes should use lookup() (or lookup_latlongs).
+    '''
+    def __init__(self, postcodes, lats, lngs):
+        postcodes = np.asarray(postcodes, dtype=np.bytes_)
+        order = np.argsort(postcodes, kind='stable')
+        postcodes = postcodes[order]
+        unique = np.r_[True, postcodes[1:] != postcodes[:-1]][:len(postcodes)]  # keep the first of any duplicated postcodes
+
+        self.postcodes = postcodes[unique]
+        self.lats = np.asarray(lats, dtype=np.float64)[order][unique]
+        self.lngs = np.asarray(lngs, dtype=np.float64)[order][unique]
+        self._latlongs = None
+        self._build_code_index()
+
+    def _build_code_index(self):
+        '''
+        Builds the outcode and sector indexes: sorted unique codes plus the start of each code's range in the arrays.
+
+        A space sorts before any letter or digit, so each outcode ('SW1' < 'SW10' < 'SW1A') and each sector is contiguous
+        and the codes come out in sorted order.
+        '''
+        parts = np.char.partition(self.postcodes, b' ') if len(self.postcodes) else np.zeros((0, 3), dtype='S1')
+        outcodes = parts[:, 0]
+        sectors = np.char.add(np.char.add(outcodes, b' '), parts[:, 2].astype('S1'))  # 'SW1A 1AA' -> 'SW1A 1'
+        self.outcodes, self.outcodeStarts, self.outcodeCodes = _ranges(outcodes)
+        self.sectors, self.sectorStarts, self.sectorCodes = _ranges(sectors)
+
+    @classmethod
+    def from_df(cls, df, postcodeCol='pcds', latCol='lat', lngCol='long'):
+        return cls(df[postcodeCol].to_numpy(dtype=str), df[latCol].to_numpy(), df[lngCol].to_numpy())
+
+    def index(self, postcode):
+        '''
+        Returns the array position of 'postcode', or -1 if it isn't in the store.
+        '''
+        key = postcode.encode() if isinstance(postcode, str) else postcode
+        i = np.searchsorted(self.postcodes, key)
+        if i < len(self.postcodes) and self.postcodes[i] == key:
+            return int(i)
+        return -1
+
+    def indices(self, postcodes):
+        '''
+        Returns the array position of every postcode in 'postcodes' at once (-1 for those not in the store).
+        '''
+        keys = np.asarray(postcodes, dtype=np.bytes_).reshape(-1)
+        if not len(self.postcodes):
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.postcodes, keys), len(self.postcodes) - 1)
+        return np.where(self.postcodes[positions] == keys, positions, -1)
+
+    def lookup(self, postcodes):
+        '''
+        Returns a (len(postcodes), 2) array of lat/longs, NaN for postcodes not in the store.
+        '''
+        positions = self.indices(postcodes)
+        found = positions >= 0
+        latlongs = np.full((len(positions), 2), np.nan)
+        latlongs[found, 0] = self.lats[positions[found]]
+        latlongs[found, 1] = self.lngs[positions[found]]
+        return latlongs
+
+    def __getitem__(self, postcode):
+        i = self.index(postcode)
+        if i < 0:
+            raise KeyError(postcode)
+        return (float(self.lats[i]), float(self.lngs[i]))
+
+    def __contains__(self, postcode):
+        return isinstance(postcode, (str, bytes)) and self.index(postcode) >= 0
+
+    def __iter__(self):
+        return iter(self.postcodes.astype(str).tolist())
+
+    def __len__(self):
+        return len(self.postcodes)
+
+    def items(self):
+        return _StoreItems(self)
+
+    def values(self):
+        return _StoreValues(self)
+
+    def outcode_slice(self, outcode):
+        '''
+        Returns the slice of the arrays holding every postcode in 'outcode' (an empty slice if there are none).
+        '''
+        return _code_slice(self.outcodes, self.outcodeStarts, outcode)
+
+    def sector_slice(self, sector):
+        '''
+        Returns the slice of the arrays holding every postcode in 'sector', e.g. 'SW1A 1'.
+        '''
+        return _code_slice(self.sectors, self.sectorStarts, sector)
+
+    def get_outcodes(self, prefix=''):
+        '''
+        Returns the sorted outcodes starting with 'prefix', e.g. 'SW1' (or 'SW1*') for SW1, SW1A ... SW19.
+        '''
+        return _codes_with_prefix(self.outcodes, prefix)
+
+    def get_sectors(self, prefix=''):
+        '''
+        Returns the sorted postcode sectors starting with 'prefix', e.g. 'SW1A' or 'SW1A 1'.
+        '''
+        return _codes_with_prefix(self.sectors, prefix)
+
+    @property
+    def latlongs(self):
+        '''
+        (lat, long) -> [postcodes] view over the store, replacing the old 'latlongDict'.
+        '''
+        if self._latlongs is None:
+            self._latlongs = LatLongView(self)
+        return self._latlongs
+
+    @property
+    def nbytes(self):
+        arrays = (self.postcodes, self.lats, self.lngs, self.outcodes, self.outcodeStarts, self.outcodeCodes, self.sectors, self.sectorStarts, self.sectorCodes)
+        return sum(array.nbytes for array in arrays) + (self._latlongs.nbytes if self._latlongs is not None else 0)
+
+
+class _StoreItems(ItemsView):
+    def __iter__(self):
+        store = self._mapping
+        return zip(iter(store), zip(store.lats.tolist(), store.lngs.tolist()))
+
+
+class _StoreValues(ValuesView):
+    def __iter__(self):
+        store = self._mapping
+        return zip(store.lats.tolist(), store.lngs.tolist())
+
+
+def lookup_latlongs(postcodeDict, postcodes):
+    '''
+    Returns a (len(postcodes), 2) array of lat/longs (NaN for unknown postcodes) from a PostcodeStore in one vectorized
+    lookup, or from any other postcode -> (lat, long) mapping one postcode at a time.
+    '''
+    if isinstance(postcodeDict, PostcodeStore):
+        return postcodeDict.lookup(postcodes)
+    return np.array([postcodeDict.get(postcode, (np.nan, np.nan)) for postcode in postcodes], dtype=np.float64).reshape(-1, 2)
+
+
+def _ranges(codes):
+    '''
+    Splits a sorted array of codes into (unique codes, range starts with a final end, code number of each element).
+    '''
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]][:len(codes)])
+    numbers = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(codes))))
+    return codes[starts], np.append(starts, len(codes)), numbers
+
+
+def _code_slice(codes, starts, code):
+    key = code.encode()
+    i = np.searchsorted(codes, key)
+    if i < len(codes) and codes[i] == key:
+        return slice(int(starts[i]), int(starts[i+1]))
+    return slice(0, 0)
+
+
+def _codes_with_prefix(codes, prefix):
+    prefix = prefix.rstrip('*').encode()
+    lo = np.searchsorted(codes, prefix)
+    hi = np.searchsorted(codes, prefix + b'\xff')
+    return [code.decode() for code in codes[lo:hi]]
+
+
+class LatLongView(Mapping):
+    '''
+    Read-only (lat, long) -> [postcodes] mapping over a PostcodeStore.
+
+    Iterates lat/longs in order of their first postcode, and lists each group's postcodes in sorted order.
+    '''
+    def __init__(self, store):
+        self.store = store
+        order = np.lexsort((np.arange(len(store)), store.lngs, store.lats))
+        lats, lngs = store.lats[order], store.lngs[order]
+        starts = np.flatnonzero(np.r_[True, (lats[1:] != lats[:-1]) | (lngs[1:] != lngs[:-1])][:len(order)])
+
+        self.members = order
+        self.starts = np.append(starts, len(order))
+        self.lats = lats[starts]
+        self.lngs = lngs[starts]
+        self.iterOrder = np.argsort(order[starts], kind='stable')
+        self.groupOf = np.empty(len(order), dtype=np.int64)  # store position -> lat/long group
+        self.groupOf[order] = np.repeat(np.arange(len(starts)), np.diff(self.starts))
+
+    def _group(self, latlong):
+        try:
+            lat, lng = latlong
+        except (TypeError, ValueError):
+            return -1
+        lo = np.searchsorted(self.lats, lat, side='left')
+        hi = np.searchsorted(self.lats, lat, side='right')
+        i = lo + np.searchsorted(self.lngs[lo:hi], lng)
+        if i < hi and self.lngs[i] == lng:
+            return int(i)
+        return -1
+
+    def group_indices(self, group):
+        '''
+        Returns the store positions of every postcode in lat/long group 'group'.
+        '''
+        return self.members[self.starts[group]:self.starts[group+1]]
+
+    def __getitem__(self, latlong):
+        group = self._group(latlong)
+        if group < 0:
+            raise KeyError(latlong)
+        return [postcode.decode() for postcode in self.store.postcodes[self.group_indices(group)]]
+
+    def __contains__(self, latlong):
+        return self._group(latlong) >= 0
+
+    def __iter__(self):
+        return ((float(self.lats[i]), float(self.lngs[i])) for i in self.iterOrder)
+
+    def __len__(self):
+        return len(self.lats)
+
+    @property
+    def nbytes(self):
+        return self.members.nbytes + self.starts.nbytes + self.lats.nbytes + self.lngs.nbytes + self.iterOrder.nbytes + self.groupOf.nbytes
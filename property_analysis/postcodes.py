@@ -1,20 +1,50 @@
-from math import sqrt
-import time
+import hashlib
+import os
+import pickle
+import numpy as np
 import pandas as pd
 
+from .instrument import span, timed
+from .postcode_store import PostcodeStore
+from .spatial import k_nearest_haversine
+
+DROP_COLUMNS = ['pcd', 'pcd2', 'doterm', 'oscty', 'ced', 'oslaua', 'osward', 'parish', 'usertype', 'oseast1m', 'osnrth1m', 'osgrdind', 'oshlthau', 'nhser', 'ctry', 'rgn', 'streg', 'eer', 'teclec', 'ttwa', 'pct', 'nuts', 'statsward', 'oa01', 'casward', 'park', 'lsoa01', 'msoa01', 'ur01ind', 'oac01', 'wz11', 'ccg', 'ru11ind', 'lep1', 'lep2', 'pfa', 'calncv', 'stp']
+EXTENDED_COLUMNS = ['dointr', 'pcon', 'oa11', 'lsoa11', 'msoa11', 'bua11', 'buasd11', 'oac11']
+LOAD_COLUMNS = ['doterm', 'osward']  # dropped by get_df, but needed by _drop_expired and df_add_ward_lad
+RENAME_COLUMNS = {'pcds': 'postcode', 'imd': 'deprivationRank', 'lat': 'latitude', 'long': 'longitude'}
+
 class Postcodes(object):
     def __init__(self):
         self.postcodeDict = {}
         self.latlongDict = {}
         self.outcodes = []
+        self.lookups = []  # (key column, lookup DataFrame indexed by code) pairs joined by get_df
 
-    def load(self, csvPath: str, drop_exp=True, outcodes_to_drop=['CR90', 'N1P', 'N81', 'NW1W', 'NW26', 'SE1P'], dicts=True):
+    @timed('postcodes.load')
+    def load(self, csvPath: str, drop_exp=True, outcodes_to_drop=['CR90', 'N1P', 'N81', 'NW1W', 'NW26', 'SE1P'], dicts=True, cacheDir=None, usecols=None):
         '''
         Loads local csv of postcodes to a pandas DataFrame and (by default) cleans and extracts the important bits to object attributes.
 
         Latest csv postcode dataset for London can be found at: https://data.london.gov.uk/dataset/postcode-directory-for-london
+
+        'usecols' can be a list of columns to read, or 'get_df' to read only the columns that get_df keeps.
+        With 'cacheDir' the cleaned DataFrame is saved to a columnar file (Parquet if pyarrow is installed, otherwise a pickle)
+        keyed by the csv contents and the load options, and later loads read that file instead of the csv.
         '''
-        self.df = pd.read_csv(csvPath, low_memory=False)
+        if usecols == 'get_df':
+            usecols = lambda column: column not in DROP_COLUMNS or column in LOAD_COLUMNS
+
+        if cacheDir:
+            cachePath = self._cache_path(cacheDir, csvPath, drop_exp, outcodes_to_drop, usecols)
+            if os.path.exists(cachePath):
+                self.df = self._read_cache(cachePath)
+                self._categorize()
+                print('Postcodes: loaded cache', cachePath)
+                if dicts:
+                    self._create_dicts()
+                return
+
+        self.df = pd.read_csv(csvPath, low_memory=False, usecols=usecols)
         print('Postcodes: loaded csv')
 
         if drop_exp:
@@ -23,9 +53,51 @@ class Postcodes(object):
         if outcodes_to_drop:
             self._drop_outcodes(outcodes_to_drop)  # The default dropped outcodes are only for London-based post office sorting locations.
 
+        self._categorize()
+
+        if cacheDir:
+            self._write_cache(cachePath)
+
         if dicts:
             self._create_dicts()
 
+    @staticmethod
+    def _cache_path(cacheDir, csvPath, drop_exp, outcodes_to_drop, usecols):
+        '''
+        Returns the cache file path for a csv and set of load options (remote csvs are keyed by their URL).
+        '''
+        sha = hashlib.sha1()
+        if os.path.isfile(csvPath):
+            with open(csvPath, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+        else:
+            sha.update(csvPath.encode())
+        if callable(usecols):
+            usecols = 'get_df'
+        elif usecols is not None:
+            usecols = sorted(usecols)
+        sha.update(repr((drop_exp, sorted(outcodes_to_drop or []), usecols)).encode())
+
+        ext = 'parquet' if _has_pyarrow() else 'pkl'
+        return os.path.join(cacheDir, 'postcodes_{}.{}'.format(sha.hexdigest()[:20], ext))
+
+    @staticmethod
+    def _read_cache(cachePath):
+        if cachePath.endswith('.parquet'):
+            return pd.read_parquet(cachePath)
+        return pd.read_pickle(cachePath)
+
+    def _write_cache(self, cachePath):
+        os.makedirs(os.path.dirname(cachePath) or '.', exist_ok=True)
+        tmpPath = cachePath + '.tmp'
+        if cachePath.endswith('.parquet'):
+            self.df.to_parquet(tmpPath, index=False)
+        else:
+            self.df.reset_index(drop=True).to_pickle(tmpPath, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, cachePath)
+        print('Postcodes: saved cache', cachePath)
+
     def _drop_expired(self):
         '''
         Drops all postcodes marked with an expiry date from the DataFrame.
@@ -37,80 +109,140 @@ class Postcodes(object):
         '''
         Drops postcodes that start with the outcodes specified in 'to_drop' from the DataFrame.
         '''
-        self.df['outcode'] = [postcode.split(' ')[0] for postcode in self.df['pcds']]
+        self.df['outcode'] = self.df['pcds'].str.partition(' ')[0]
         self.df = self.df[~self.df['outcode'].isin(to_drop)]
         print('Postcodes: dropped selected outcodes')
 
+    def _categorize(self, maxRatio=0.5):
+        '''
+        Stores text columns with at most 'maxRatio' unique values per row (codes for wards, constituencies, output areas etc.)
+        as categoricals.
+        '''
+        for column in self.df.columns:
+            values = self.df[column]
+            if column != 'pcds' and pd.api.types.is_string_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+                categorical = values.astype('category')
+                if len(categorical.cat.categories) <= maxRatio * len(values):
+                    self.df[column] = categorical
+
     def _create_dicts(self):
         '''
-        Adds two dictionaries to object attributes: 
+        Adds two mappings to object attributes, backed by a compact PostcodeStore:
         1) postcode -> (lat, long)
-        2) (lat, long) -> postcode
-        '''
-        self.postcodeDict = {postcode: (lat, lon) for postcode, lat, lon in zip(self.df['pcds'], self.df['lat'], self.df['long'])}
-        for postcode, latlong in self.postcodeDict.items():
-            if latlong in self.latlongDict:
-                self.latlongDict[latlong].append(postcode)
-            else:
-                self.latlongDict[latlong] = [postcode]
+        2) (lat, long) -> postcodes
+        '''
+        self.postcodeDict = PostcodeStore.from_df(self.df)
+        self.latlongDict = self.postcodeDict.latlongs
         print('Postcodes: created dicts')
 
-    def get_outcodes(self):
+    def get_outcodes(self, prefix=''):
         '''
         Returns sorted list of all unique outcodes (first part of a UK postcode) in these postcodes.
+
+        With 'prefix' only matching outcodes are returned, e.g. 'SW1' (or 'SW1*') for SW1, SW10 ... SW1A ... SW1Y.
         '''
-        if not self.outcodes:
-            for postcode in self.postcodeDict.keys():
-                if postcode.split(' ')[0] in self.outcodes:
-                    continue
-                else:
-                    self.outcodes.append(postcode.split(' ')[0])
-            self.outcodes.sort()
+        if isinstance(self.postcodeDict, PostcodeStore):
+            return self.postcodeDict.get_outcodes(prefix)
 
-        return self.outcodes
+        if not self.outcodes:
+            self.outcodes = sorted({postcode.split(' ')[0] for postcode in self.postcodeDict.keys()})
+        prefix = prefix.rstrip('*')
+        return [outcode for outcode in self.outcodes if outcode.startswith(prefix)]
 
     def df_add_ward_lad(self, csvPath):
-        lookupDf = pd.read_csv(csvPath, index_col='WD19CD')
-        lookupDf.drop(columns=['FID', 'LAD19CD'], inplace=True)
+        '''
+        Adds 'ward' and 'localAuthority' names, reading only those columns from the (UK-wide) lookup csv. They are joined
+        on 'osward' as categoricals by get_df.
+        '''
+        lookupDf = pd.read_csv(csvPath, usecols=['WD19CD', 'WD19NM', 'LAD19NM'], index_col='WD19CD', dtype=str)
         lookupDf.rename(columns={'WD19NM': 'ward', 'LAD19NM': 'localAuthority'}, inplace=True)
-        self.df = self.df.join(lookupDf, on='osward')
+        self._add_lookup('osward', lookupDf)
         return print('Postcodes: Added Ward & Local Authority District names to df.')
 
     def df_add_oac(self, csvPath):
-        oacDf = pd.read_csv(csvPath)
-        oacDf.index = [text.split(':')[0] for text in oacDf['Subgroup']]
-        oacDf.drop(columns=['ObjectId'], inplace=True)
+        '''
+        Adds Output Area Classification names, joined on 'oac11' as categoricals by get_df.
+        '''
+        oacDf = pd.read_csv(csvPath, usecols=['Supergroup', 'Group_', 'Subgroup'], dtype=str)
+        oacDf.index = oacDf['Subgroup'].str.split(':').str[0]
         oacDf.rename(columns={'Supergroup': 'oacSupergroup', 'Group_': 'oacGroup', 'Subgroup': 'oacSubgroup'}, inplace=True)
-        self.df = self.df.join(oacDf, on='oac11')
+        self._add_lookup('oac11', oacDf)
         return print('Postcodes: Added Output Area Classifications to df.')
 
-    def df_add_nearest_station(self, csvPath):
-
-        def nearest_station(lat, lng):
-            nearest = (None, None, float('inf'))
-            for lat2,lng2 in latlongDict.keys():
-                distance = sqrt((lat-lat2)**2 + (lng-lng2)**2)
-                if distance < nearest[2]:
-                    nearest = (*latlongDict[lat2, lng2], distance)
-            return nearest
-
-        print('Postcodes: Calculating nearest stations (may take a while)...')
-        start = time.monotonic()
-        stationsDf = pd.read_csv(csvPath)
-        latlongDict = {(row.Latitude, row.Longitude): (row.Station, row.Zone) for row in stationsDf.itertuples()}
-        self.df[['nearestStation', 'stationZone', 'stationDistance']] = [nearest_station(lat, lng) for lat, lng in zip(self.df['lat'], self.df['long'])]
-        return print('Postcodes: Added nearest stations to df ({:.2f} secs).'.format(time.monotonic()-start))
-
-    def get_df(self, drop_rename=True, dropExtended=False):
-        df = self.df.copy()
+    def _add_lookup(self, key, lookupDf):
+        '''
+        Keeps only the lookup rows for codes present in self.df[key], as categoricals.
+        '''
+        lookupDf = lookupDf[~lookupDf.index.duplicated(keep='first')]
+        lookupDf = lookupDf[lookupDf.index.isin(pd.unique(np.asarray(self.df[key], dtype=object)))]
+        columns = set(lookupDf.columns)
+        self.lookups = [(k, df.drop(columns=columns, errors='ignore')) for k, df in self.lookups if not columns.issuperset(df.columns)]
+        self.lookups.append((key, lookupDf.astype('category')))
+
+    def df_add_nearest_station(self, csvPath, k=1, radius=None):
+        '''
+        Adds the nearest station, its zone and its haversine distance in metres to every postcode in the DataFrame.
+
+        With k > 1 the 2nd..kth nearest stations are added as 'nearestStation2', 'stationZone2', 'stationDistance2' etc.
+        Stations further than 'radius' metres are left empty.
+        '''
+        with span('postcodes.nearest_station', k=k) as timer:
+            stationsDf = pd.read_csv(csvPath)
+            distances, indices = k_nearest_haversine(self.df['lat'], self.df['long'], stationsDf['Latitude'], stationsDf['Longitude'], k=k, radius=radius)
+
+        stations = np.append(stationsDf['Station'].to_numpy(dtype=object), None)  # index -1 -> None
+        zones = np.append(stationsDf['Zone'].to_numpy(dtype=object), None)
+        distances[np.isinf(distances)] = np.nan
+        for i in range(k):
+            suffix = str(i+1) if i else ''
+            self.df['nearestStation'+suffix] = stations[indices[:, i]]
+            self.df['stationZone'+suffix] = zones[indices[:, i]]
+            self.df['stationDistance'+suffix] = distances[:, i]
+        return print('Postcodes: Added nearest stations to df ({:.2f} secs).'.format(timer.duration))
+
+    def get_df(self, drop_rename=True, dropExtended=False, columns=None):
+        '''
+        Returns the postcodes DataFrame with the lookups from df_add_ward_lad / df_add_oac joined on.
+
+        Only the kept columns (or just 'columns', by their output names) are taken from self.df, rather than copying it
+        whole and dropping columns afterwards.
+        '''
+        lookupColumns = {column: (key, lookupDf) for key, lookupDf in self.lookups for column in lookupDf.columns}
         if drop_rename:
-            df.drop(columns=['pcd', 'pcd2', 'doterm', 'oscty', 'ced', 'oslaua', 'osward', 'parish', 'usertype', 'oseast1m', 'osnrth1m', 'osgrdind', 'oshlthau', 'nhser', 'ctry', 'rgn', 'streg', 'eer', 'teclec', 'ttwa', 'pct', 'nuts', 'statsward', 'oa01', 'casward', 'park', 'lsoa01', 'msoa01', 'ur01ind', 'oac01', 'wz11', 'ccg', 'ru11ind', 'lep1', 'lep2', 'pfa', 'calncv', 'stp'], inplace=True)
-            if dropExtended:
-                df.drop(columns=['dointr', 'pcon', 'oa11', 'lsoa11', 'msoa11', 'bua11', 'buasd11', 'oac11'], inplace=True)
-            df.rename(columns={'pcds': 'postcode', 'imd': 'deprivationRank', 'lat': 'latitude', 'long': 'longitude'}, inplace=True)
-            df.set_index('postcode', inplace=True)
+            dropped = set(DROP_COLUMNS) | (set(EXTENDED_COLUMNS) if dropExtended else set())
+            wanted = [column for column in self.df.columns if column not in dropped]
+        else:
+            wanted = list(self.df.columns)
+        wanted += [column for column in lookupColumns if column not in wanted]
+        if columns is not None:
+            sourceNames = {new: old for old, new in RENAME_COLUMNS.items()} if drop_rename else {}
+            requested = {sourceNames.get(column, column) for column in columns}
+            if drop_rename:
+                requested.add('pcds')
+            wanted = [column for column in wanted if column in requested]
+
+        df = self.df[[column for column in wanted if column in self.df.columns]]
+        for column in wanted:
+            if column in lookupColumns and column not in self.df.columns:
+                key, lookupDf = lookupColumns[column]
+                positions = lookupDf.index.get_indexer(np.asarray(self.df[key], dtype=object))
+                values = lookupDf[column].array
+                codes = np.full(len(positions), -1, dtype=values.codes.dtype)
+                found = positions >= 0
+                codes[found] = values.codes[positions[found]]
+                df[column] = pd.Categorical.from_codes(codes, dtype=values.dtype)
+
+        if drop_rename:
+            df = df.rename(columns=RENAME_COLUMNS).set_index('postcode')
         return df
 
+def _has_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
 if __name__ == "__main__":
 
     p = Postcodes()
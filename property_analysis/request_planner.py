@@ -0,0 +1,82 @@
+import numpy as np
+
+from .spatial import k_nearest_haversine
+
+class RequestPlan(object):
+    '''
+    Which postcodes to request, and how to fan their results back out.
+
+    'groups' maps each representative postcode to every postcode sharing its exact lat/long (itself included).
+    'approximated' lists postcodes with no request of their own, whose journey times are interpolated from nearby
+    representatives.
+    '''
+    def __init__(self, groups, approximated=(), postcodeDict=None):
+        self.groups = groups
+        self.approximated = list(approximated)
+        self.postcodeDict = postcodeDict
+
+    @property
+    def representatives(self):
+        return list(self.groups.keys())
+
+    def savings(self):
+        postcodes = sum(len(members) for members in self.groups.values()) + len(self.approximated)
+        requests = len(self.groups)
+        return {'postcodes': postcodes, 'requests': requests, 'saved': postcodes - requests, 'savedPct': 100 * (postcodes - requests) / postcodes if postcodes else 0.0}
+
+    def __str__(self):
+        return '{postcodes} postcodes -> {requests} requests ({savedPct:.1f}% saved)'.format(**self.savings())
+
+    def interpolate(self, journeyTimes, k=4):
+        '''
+        Returns {postcode: journeyTime} for every approximated postcode, by inverse-distance weighting of the
+        'journeyTimes' ({representative: minutes}) of its k nearest representatives.
+        '''
+        reps = [rep for rep in self.groups if rep in journeyTimes]
+        if not self.approximated or not reps:
+            return {}
+        repLatlongs = np.array([self.postcodeDict[rep] for rep in reps], dtype=np.float64)
+        repTimes = np.array([journeyTimes[rep] for rep in reps], dtype=np.float64)
+        latlongs = np.array([self.postcodeDict[postcode] for postcode in self.approximated], dtype=np.float64)
+
+        distances, indices = k_nearest_haversine(latlongs[:, 0], latlongs[:, 1], repLatlongs[:, 0], repLatlongs[:, 1], k=min(k, len(reps)))
+        weights = 1 / np.maximum(distances, 1)**2  # within 1m counts as an exact match
+        times = (weights * repTimes[indices]).sum(axis=1) / weights.sum(axis=1)
+        return dict(zip(self.approximated, times.round(1).tolist()))
+
+def plan_requests(postcodeDict, approximate=None, cellSize=0.01):
+    '''
+    Collapses postcodes sharing an exact lat/long into one request each.
+
+    With approximate='sector' only one lat/long per postcode sector is requested, and with approximate='grid' one per
+    'cellSize' degree grid cell; in both cases the one nearest the centre of its sector/cell, with the rest interpolated.
+    '''
+    latlongGroups = {}
+    for postcode, latlong in postcodeDict.items():
+        latlongGroups.setdefault(latlong, []).append(postcode)
+
+    if approximate is None:
+        return RequestPlan({postcodes[0]: postcodes for postcodes in latlongGroups.values()}, postcodeDict=postcodeDict)
+
+    areas = {}
+    for (lat, lng), postcodes in latlongGroups.items():
+        if approximate == 'sector':
+            area = postcodes[0][:-2]
+        elif approximate == 'grid':
+            area = (int(np.floor(lat / cellSize)), int(np.floor(lng / cellSize)))
+        else:
+            raise Exception('plan_requests "approximate" must be None, "sector" or "grid"')
+        areas.setdefault(area, []).append(((lat, lng), postcodes))
+
+    groups = {}
+    approximated = []
+    for members in areas.values():
+        latlongs = np.array([latlong for latlong, _ in members])
+        centre = latlongs.mean(axis=0)
+        nearest = int(np.hypot(*(latlongs - centre).T).argmin())
+        for i, (_, postcodes) in enumerate(members):
+            if i == nearest:
+                groups[postcodes[0]] = postcodes
+            else:
+                approximated.extend(postcodes)
+    return RequestPlan(groups, approximated, postcodeDict)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+class ResponseCache(object):
+    '''
+    SQLite-backed cache of JSON responses, keyed by URL and normalised params (API keys are left out of the key).
+
+    Entries expire after 'ttl' seconds (None: never), or after a response's own 'recommendedMaxAgeMinutes' (TfL) when
+    'honourMaxAge' is set. Least recently used entries are evicted beyond 'maxEntries' or 'maxBytes', in batches down to
+    'lowWater' of the limit, and expired entries are purged every 'purgeEvery' inserts, so inserts stay cheap.
+    Every response is committed as it arrives, so an interrupted run can be resumed from the cache.
+    '''
+    def __init__(self, path, ttl=None, maxEntries=None, maxBytes=None, honourMaxAge=True, ignoreParams=('app_id', 'app_key'), lowWater=0.9, purgeEvery=1000):
+        self.path = path
+        self.ttl = ttl
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.honourMaxAge = honourMaxAge
+        self.ignoreParams = set(ignoreParams)
+        self.lowWater = lowWater
+        self.purgeEvery = purgeEvery
+        self.hits = 0
+        self.misses = 0
+        self._inserts = 0
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, url TEXT, status INTEGER, body TEXT, size INTEGER, created REAL, expires REAL, accessed REAL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+        self.conn.commit()
+        # running totals, so limits are checked without scanning the table
+        self.entries, self.bytes = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+
+    def key(self, url, params={}):
+        items = sorted((str(k), str(v)) for k, v in params.items() if k not in self.ignoreParams)
+        return hashlib.sha1(json.dumps([url, items]).encode()).hexdigest()
+
+    def get(self, url, params={}):
+        '''
+        Returns (json, status) for a cached response, or None.
+        '''
+        key = self.key(url, params)
+        row = self.conn.execute('SELECT body, status, expires FROM responses WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        if row is None or (row[2] is not None and row[2] < now):
+            self.misses += 1
+            return None
+        self.conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, url, params, result, status, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        if self.honourMaxAge and isinstance(result, dict) and result.get('recommendedMaxAgeMinutes'):
+            ttl = result['recommendedMaxAgeMinutes'] * 60
+        now = time.time()
+        body = json.dumps(result)
+        key = self.key(url, params)
+        old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if old is not None:
+            self.entries -= 1
+            self.bytes -= old[0]
+        self.conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                          (key, url, status, body, len(body), now, now + ttl if ttl is not None else None, now))
+        self.entries += 1
+        self.bytes += len(body)
+
+        self._inserts += 1
+        if self._inserts % self.purgeEvery == 0 or self._over_limit():
+            self.evict()
+        self.conn.commit()
+
+    def _over_limit(self, fraction=1):
+        return ((self.maxEntries is not None and self.entries > self.maxEntries * fraction) or
+                (self.maxBytes is not None and self.bytes > self.maxBytes * fraction))
+
+    def evict(self):
+        '''
+        Drops expired entries, then (when over 'maxEntries' / 'maxBytes') the least recently used entries until the cache
+        is back down to 'lowWater' of its limits.
+        '''
+        now = time.time()
+        count, size = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE expires < ?', (now,)).fetchone()
+        if count:
+            self.conn.execute('DELETE FROM responses WHERE expires < ?', (now,))
+            self.entries -= count
+            self.bytes -= size
+        if not self._over_limit():
+            return
+        toDrop = []
+        for key, size in self.conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if not self._over_limit(self.lowWater):
+                break
+            toDrop.append((key,))
+            self.entries -= 1
+            self.bytes -= size
+        self.conn.executemany('DELETE FROM responses WHERE key = ?', toDrop)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': self.entries, 'bytes': self.bytes}
+
+    def clear(self):
+        self.conn.execute('DELETE FROM responses')
+        self.conn.commit()
+        self.entries = self.bytes = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
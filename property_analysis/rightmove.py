@@ -1,14 +1,32 @@
 import asyncio
 import os
+from bisect import bisect_left
 import json
+import random
+import re
+import numpy as np
 import pandas as pd
-from math import sqrt
-from time import time
 
-from .async_requests import AsyncRequests
-
-class Rightmove(object):
-    def __init__(self, outcodes, rateLimit=0.5):
+from .async_requests import AsyncClient, run_sync
+from .listing_index import ListingIndex
+from .instrument import count, span, timed
+from .listing_query import ListingQuery
+from .listing_store import ListingStore
+from .ndjson import NdjsonWriter, is_ndjson, read_ndjson_chunks
+from .parallel import postprocess_sharded
+from .response_cache import ResponseCache
+from .postcode_store import LatLongView
+from .spatial import NearestIndex
+from .tfl import JourneyMatrix
+from .travel_raster import TravelTimeRaster
+
+class Rightmove(AsyncClient):
+    '''
+    Rightmove property search. Every search has an async version ('..._async') for use inside a running event loop;
+    'async with Rightmove(...)' keeps one session open across searches, and an HttpPool 'pool' shares its connection
+    pool with other clients.
+    '''
+    def __init__(self, outcodes, rateLimit=0.5, burst=1, maxInFlight=None, cache=None, cacheTtl=6*60*60, index=None, pageRetries=2, pool=None):
         self.url = 'https://api.rightmove.co.uk/api/'
         self.apiApplication = 'ANDROID'
 
@@ -19,19 +37,65 @@ class Rightmove(object):
 
         self.load_outcodes(outcodes)
         self.rateLimit = rateLimit
+        self.burst = burst
+        self.maxInFlight = maxInFlight
+        self.pool = pool
+        # path or ResponseCache; Rightmove responses carry no max age, so cached pages need a ttl to ever expire
+        self.cache = ResponseCache(cache, ttl=cacheTtl) if isinstance(cache, str) else cache
+        if self.cache is not None and self.cache.ttl is None:
+            raise Exception('Rightmove needs a ResponseCache with a ttl, or cached search pages would never expire')
+        self.index = ListingIndex(index) if isinstance(index, str) else index  # path or ListingIndex, for incremental searches
+        self.pageRetries = pageRetries
+        self.listings = ListingStore()
+        self.deltas = {}
+        self.gaps = {}  # location (outcode, as in listings.info): indexes of pages that couldn't be fetched
+
+    @classmethod
+    def _from_listings(cls, outcodes, df):
+        '''
+        Bare Rightmove holding already fetched listings, for post-processing them in a worker process.
+        '''
+        rightmove = cls.__new__(cls)
+        rightmove.outcodes = list(outcodes)
+        rightmove.listings = ListingStore()
+        rightmove.listings.df = df
+        return rightmove
 
     def load_outcodes(self, outcodes):
-        self.outcodes = outcodes
+        '''
+        Loads the outcodes to search. Entries ending in '*' are expanded to every Rightmove outcode with that prefix, e.g. 'SW1*'.
+        '''
+        self.outcodes = []
         self.locations = []
 
+        sortedOutcodes = sorted(self.outcodesDict)
         for outcode in outcodes:
+            if outcode.endswith('*'):
+                prefix = outcode[:-1]
+                start = bisect_left(sortedOutcodes, prefix)
+                end = bisect_left(sortedOutcodes, prefix + '\uffff')
+                self.outcodes.extend(sortedOutcodes[start:end])
+            else:
+                self.outcodes.append(outcode)
+
+        for outcode in self.outcodes:
             try:
                 self.locations.append("OUTCODE^{}".format(self.outcodesDict[outcode]))
             except:
                 print('Warning: no outcode code for', outcode)
 
-    def search_properties(self, propType:'rent' or 'sale', params:dict, limit=None, dropResults=['share', 'garage', 'retirement', 'park', 'multiple']):
+    def search_properties(self, propType:'rent' or 'sale', params:dict, limit=None, dropResults=['share', 'garage', 'retirement', 'park', 'multiple'], incremental=False):
+        return run_sync(self.search_properties_async(propType, params, limit, dropResults, incremental), self.pool)
+
+    @timed('rightmove.search')
+    async def search_properties_async(self, propType:'rent' or 'sale', params:dict, limit=None, dropResults=['share', 'garage', 'retirement', 'park', 'multiple'], incremental=False):
         """
+        Pages that fail even after retrying are listed per location in self.gaps.
+
+        With 'incremental' (needs a ListingIndex) results are sorted newest first and paging of an outcode stops at the
+        first page made up entirely of listings already in the index. New listings, price changes and (for outcodes paged
+        all the way through) removals are recorded in the index and returned in self.deltas.
+
         Example of 'params' dict:
             params = {
                     'minBedrooms': '1',
@@ -45,11 +109,6 @@ class Rightmove(object):
                     #'keywords': '',
                     }
         """
-        async def run(url, params):
-            self.requests = AsyncRequests(rateLimit=self.rateLimit)
-            await asyncio.gather(*[asyncio.ensure_future(self._fetch_location(url, params, location)) for location in self.locations[:limit]])
-            await self.requests.close()
-
         if not self.locations:
             raise Exception('Must load Rightmove locations before property search')
 
@@ -67,102 +126,326 @@ class Rightmove(object):
 
         params.update({'apiApplication': self.apiApplication, 'numberOfPropertiesRequested': '50'})
 
-        self.results = {}
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(run(url, params))
-
-        print('Rightmove: {} total properties found'.format(len(self.resultsList)))
+        self._knownIds = None
+        if incremental:
+            if self.index is None:
+                raise Exception('search_properties "incremental" needs a ListingIndex')
+            params['sortType'] = '6'  # newest listed first
+            search = ListingIndex.search_key(propType, params)
+            self._knownIds = self.index.known_identifiers(search)
+
+        self.listings = ListingStore()
+        self.gaps = {}
+        async with self._session():
+            with span('rightmove.fetch', locations=len(self.locations[:limit])):
+                await asyncio.gather(*[self._fetch_location(url, params, location) for location in self.locations[:limit]])
+
+        print('Rightmove: {} total properties found'.format(len(self.listings)))
+        if self.gaps:
+            print('Rightmove: {} pages missing across {} locations (see Rightmove.gaps)'.format(sum(map(len, self.gaps.values())), len(self.gaps)))
         self._clean_results(propType=propType, toDrop=dropResults)
+
+        if incremental:  # even with no listings left, so the ones that have gone are reported as removed
+            fullLocations = [location for location, info in self.listings.info.items() if not info.get('stoppedEarly') and not info.get('missingPages')]
+            self.deltas = self.index.update(self.listings.df, search, fullLocations)
+            print('Rightmove: {} new, {} price changes, {} removed'.format(*(len(self.deltas[k]) for k in ('new', 'priceChanges', 'removed'))))
         return 
 
+    def _outcode_name(self, locationIdentifier):
+        '''
+        Outcode for an 'OUTCODE^<code>' location identifier (the identifier itself if it isn't a known outcode).
+        '''
+        if not hasattr(self, '_outcodeNames'):
+            self._outcodeNames = {'OUTCODE^{}'.format(code): outcode for outcode, code in self.outcodesDict.items()}
+        return self._outcodeNames.get(locationIdentifier, locationIdentifier)
+
     async def _fetch_location(self, url, params, locationIdentifier):
+        '''
+        Fetches page 0 to learn the total result count, then every remaining page at once through the shared limiter
+        (one at a time in incremental mode, so paging can stop early). Pages that still fail after retrying are
+        recorded as gaps in info['missingPages'] and self.gaps instead of being silently skipped.
+        '''
         params = {**params, 'locationIdentifier': locationIdentifier}
         perPage = int(params['numberOfPropertiesRequested'])
-        requestsLeft = 1
-        pageNum = 0
-        info = {}
-        properties = []
-
         keepKeys = ('createDate', 'numReturnedResults', 'radius', 'searchableLocation', 'totalAvailableResults')
 
-        while requestsLeft > 0:
-            params['index'] = pageNum * perPage
-            try:
-                result = await self.requests.fetch_json(url, params)
-                assert result['result'] == 'SUCCESS'
-                if pageNum == 0:
-                    info = {k: result[k] for k in keepKeys}
-                    requestsLeft += (result['totalAvailableResults'] - 1) // perPage
-                else:
-                    info['numReturnedResults'] += len(result['properties'])
-                properties.extend(result['properties'])
-            except Exception:
-                print('Error: RightmoveLocation for', params['locationIdentifier'])
-            requestsLeft -= 1
-            pageNum += 1
+        first = await self._fetch_page(url, params, 0)
+        if first is None:
+            # keyed by outcode like the other gaps (and listings.info), even though the response never said its name
+            locationName = self._outcode_name(locationIdentifier)
+            self.gaps[locationName] = [0]
+            return print('Error: Rightmove could not fetch the first page for', locationName)
 
+        info = {k: first[k] for k in keepKeys}
         locationName = info['searchableLocation']['name']
-        self.results[locationName] = {'info': info, 'properties': properties}
-
-        print("Rightmove: Finished {} ({}/{} successful)".format(locationName, info['numReturnedResults'], info['totalAvailableResults']))
-        # print(info)
+        self.listings.info[locationName] = info
+        self.listings.append(locationName, first['properties'])
 
+        indexes = list(range(perPage, info['totalAvailableResults'], perPage))
+        if self._knownIds is None:
+            pages = await asyncio.gather(*[self._fetch_page(url, params, index) for index in indexes])
+        else:
+            pages = []
+            page = first
+            for index in indexes:
+                if page is not None and all(prop['identifier'] in self._knownIds for prop in page['properties']):
+                    info['stoppedEarly'] = True
+                    break
+                page = await self._fetch_page(url, params, index)
+                pages.append(page)
+
+        gaps = []
+        for index, page in zip(indexes, pages):
+            if page is None:
+                gaps.append(index)
+            else:
+                info['numReturnedResults'] += len(page['properties'])
+                self.listings.append(locationName, page['properties'])
+        if gaps:
+            info['missingPages'] = gaps
+            self.gaps[locationName] = gaps
+
+        print("Rightmove: Finished {} ({}/{} successful{})".format(locationName, info['numReturnedResults'], info['totalAvailableResults'],
+                                                                    ', {} pages missing'.format(len(gaps)) if gaps else ''))
+
+    async def _fetch_page(self, url, params, index):
+        '''
+        Returns one page of results, retrying unsuccessful results with backoff, or None if it never succeeds.
+        Only successful pages are cached, so each retry goes back to Rightmove.
+        '''
+        for attempt in range(self.pageRetries + 1):
+            try:
+                result = await self.requests.fetch_json(url, {**params, 'index': index}, accept=_is_success)
+                assert result['result'] == 'SUCCESS'
+                count('rightmove.pages')
+                return result
+            except Exception as e:
+                error = e
+            if attempt < self.pageRetries:
+                await asyncio.sleep(min(self.requests.maxBackoff, self.requests.backoff * 2**attempt) * random.uniform(0.5, 1))
+        count('rightmove.missingPages')
+        print('Error: Rightmove page {} of {} failed ({!r})'.format(index, params['locationIdentifier'], error))
+        return None
+
+    @timed('rightmove.clean')
     def _clean_results(self, propType, toDrop=[]):
         if propType == 'rent':
             urlStart = 'https://www.rightmove.co.uk/property-to-rent/property-'
         elif propType == 'sale':
             urlStart = 'https://www.rightmove.co.uk/property-for-sale/property-'
 
-        for location, resultDict in self.results.items():
-            resultDict['properties'][:] = [prop for prop in resultDict['properties'] if not any(propType in prop['propertyType'] for propType in toDrop)]
-            for prop in resultDict['properties']:
-                del prop['branch']
-                del prop['displayPrices']
-                prop['location'] = location
-                prop['url'] = "{}{}.html".format(urlStart, prop['identifier'])
+        df = self.listings.df
+        if len(df):
+            if toDrop:
+                df = df[~df['propertyType'].fillna('').str.contains('|'.join(re.escape(propType) for propType in toDrop))]
+            df = df.drop(columns=['branch', 'displayPrices'], errors='ignore')
+            df['url'] = urlStart + df['identifier'].astype(str) + '.html'
+            self.listings.df = df.reset_index(drop=True)
         return print('Rightmove: Results cleaned')
 
-    def estimate_postcodes(self, latlongDict):
-        print('Rightmove: Estimating postcodes... (might take a while)')
-        start = time()
-
-        self._outcode_latlong_nest(latlongDict)
-
-        for resultDict in self.results.values():
-            for prop in resultDict['properties']:
-                nearest, distance = self._nearest_postcode(prop['location'], prop['latitude'], prop['longitude'])
-                prop['postcodeEstimate'] = nearest
-                prop['postcodeSector'] = nearest[:-2]
-                prop['postcodeDistance'] = distance
-        return print('Rightmove: Postcodes estimated in {:.2f} secs'.format(time()-start))
-
-    def _outcode_latlong_nest(self, latlongDict):
-        self.outcodeLatlongDict = {outcode: {} for outcode in self.outcodes}
-        outcodeSet = set(self.outcodes)
-        for latlong, postcodes in latlongDict.items():
-            for postcode in postcodes[::-1]:
+    def estimate_postcodes(self, latlongDict, acrossOutcodes=False):
+        '''
+        Adds the nearest postcode ('postcodeEstimate', 'postcodeSector', 'postcodeDistance') to every property.
+
+        By default only postcodes in the property's own outcode are considered. With 'acrossOutcodes' the nearest postcode
+        in any outcode is used instead, which helps for properties that sit near an outcode boundary.
+        '''
+        print('Rightmove: Estimating postcodes...')
+        with span('rightmove.estimate_postcodes', acrossOutcodes=acrossOutcodes) as timer:
+            self._build_postcode_index(latlongDict, acrossOutcodes)
+
+            df = self.listings.df
+            if not len(df):
+                return print('Rightmove: No properties to estimate postcodes for')
+            if acrossOutcodes:
+                groups = None
+            else:
+                groups = df['location'].map(self.outcodeGroups).fillna(-1).to_numpy(dtype=np.int64)
+
+            distances, indices = self.postcodeIndex.query(df['latitude'].to_numpy(dtype=np.float64), df['longitude'].to_numpy(dtype=np.float64), groups)
+
+            found = indices >= 0
+            estimates = np.full(len(df), None, dtype=object)
+            estimates[found] = np.asarray(self.indexPostcodes, dtype=object)[indices[found]]
+            df['postcodeEstimate'] = estimates
+            df['postcodeSector'] = df['postcodeEstimate'].str[:-2]
+            df['postcodeDistance'] = np.where(found, distances, np.nan)
+        return print('Rightmove: Postcodes estimated in {:.2f} secs'.format(timer.duration))
+
+    def _build_postcode_index(self, latlongDict, acrossOutcodes=False):
+        '''
+        Builds a NearestIndex over the first postcode at each lat/long, grouped by outcode.
+        '''
+        self.outcodeGroups = {outcode: i for i, outcode in enumerate(self.outcodes)}
+        if isinstance(latlongDict, LatLongView):
+            return self._build_postcode_index_from_store(latlongDict, acrossOutcodes)
+
+        seen = set()
+        lats, lngs, groups, self.indexPostcodes = [], [], [], []
+
+        for (lat, lng), postcodes in latlongDict.items():
+            for postcode in postcodes:
                 outcode = postcode.split(' ')[0]
-                if outcode in outcodeSet:
-                    self.outcodeLatlongDict[outcode][latlong] = postcode
-
-    def _nearest_postcode(self, outcode, lat, lng):
-        nearest = (None, float('inf'))
-        for lat2,lng2 in self.outcodeLatlongDict[outcode].keys():
-            distance = sqrt((lat-lat2)**2 + (lng-lng2)**2)
-            if distance < nearest[1]:
-                nearest = (self.outcodeLatlongDict[outcode][lat2, lng2], distance)
-        return nearest
-
-    def add_journey_times(self, csvPath, destName=''):
-        series = pd.read_csv(csvPath, index_col='postcode', low_memory=False)['journeyTime']
-        for resultDict in self.results.values():
-            for prop in resultDict['properties']:
-                try:
-                    prop['journeyTime'+destName.capitalize()] = series[prop['postcodeEstimate']]
-                except:
-                    print('Warning: no journey time for', prop['postcodeEstimate'])
+                if not acrossOutcodes and outcode not in self.outcodeGroups:
+                    continue
+                key = (lat, lng) if acrossOutcodes else (lat, lng, outcode)
+                if key in seen:
+                    continue
+                seen.add(key)
+                lats.append(lat)
+                lngs.append(lng)
+                groups.append(0 if acrossOutcodes else self.outcodeGroups[outcode])
+                self.indexPostcodes.append(postcode)
+
+        self.postcodeIndex = NearestIndex(lats, lngs, groups)
+
+    def _build_postcode_index_from_store(self, latlongView, acrossOutcodes):
+        '''
+        Array version of _build_postcode_index, using the store's outcode ranges instead of splitting every postcode.
+        '''
+        store = latlongView.store
+        if acrossOutcodes:
+            positions = np.arange(len(store))
+            groups = np.zeros(len(store), dtype=np.int64)
+        else:
+            slices = [(store.outcode_slice(outcode), group) for outcode, group in self.outcodeGroups.items()]
+            positions = np.concatenate([np.arange(s.start, s.stop) for s, _ in slices] + [np.array([], dtype=np.int64)])
+            groups = np.concatenate([np.full(s.stop - s.start, group) for s, group in slices] + [np.array([], dtype=np.int64)])
+
+        # keep the first (lowest) postcode for each lat/long within a group
+        keys = groups * len(latlongView) + latlongView.groupOf[positions]
+        _, first = np.unique(keys, return_index=True)
+        first = first[np.argsort(positions[first], kind='stable')]
+        positions, groups = positions[first], groups[first]
+
+        self.indexPostcodes = [postcode.decode() for postcode in store.postcodes[positions]]
+        self.postcodeIndex = NearestIndex(store.lats[positions], store.lngs[positions], groups)
+
+    @timed('rightmove.join_journey_times')
+    def add_journey_times(self, journeyTimes, destName='', sectorFallback=False):
+        '''
+        Adds 'journeyTime'+destName to every property by joining on 'postcodeEstimate' in one vectorized pass.
+
+        'journeyTimes' can be a csv path (read once and reused), a DataFrame with a 'journeyTime' column or a Series indexed
+        by postcode, or a list of (journeyTimes, destName) pairs to join several destinations at once.
+        With 'sectorFallback' postcodes without a journey time get their sector's median instead.
+        Returns a summary of matches and misses per column instead of printing every miss.
+        '''
+        if isinstance(journeyTimes, list):
+            tables = journeyTimes
+        else:
+            tables = [(journeyTimes, destName)]
+
+        df = self.listings.df
+        postcodes = df['postcodeEstimate'] if 'postcodeEstimate' in df else pd.Series(None, index=df.index, dtype=object)
+        sectors = postcodes.str[:-2] if sectorFallback else None
+
+        summary = {}
+        for source, name in tables:
+            column = 'journeyTime' + name.capitalize()
+            series = self._journey_series(source)
+            values = postcodes.map(series)
+            matched = int(values.notna().sum())
+            if sectorFallback:
+                sectorMedians = series.groupby(series.index.str[:-2]).median()
+                values = values.fillna(sectors.map(sectorMedians))
+            df[column] = values
+            found = int(values.notna().sum())
+            summary[column] = {'matched': matched, 'sectorFallback': found - matched, 'missing': len(df) - found,
+                               'missingPostcodes': sorted(set(postcodes[values.isna()].dropna()))}
+            print('Rightmove: {} added ({matched} matched, {sectorFallback} from sector medians, {missing} missing)'.format(column, **summary[column]))
+        return summary
+
+    def _journey_series(self, source):
+        '''
+        Returns a postcode-indexed journeyTime Series, caching csvs by path and modification time.
+        '''
+        if isinstance(source, pd.Series):
+            series = source
+        elif isinstance(source, pd.DataFrame):
+            series = source.set_index('postcode')['journeyTime'] if 'postcode' in source.columns else source['journeyTime']
+        else:
+            if not hasattr(self, '_journeyTables'):
+                self._journeyTables = {}
+            key = (source, os.path.getmtime(source))
+            if key not in self._journeyTables:
+                self._journeyTables[key] = pd.read_csv(source, usecols=['postcode', 'journeyTime'], index_col='postcode')['journeyTime']
+            series = self._journeyTables[key]
+        return series[~series.index.duplicated(keep='last')]
+
+    @timed('rightmove.join_journey_matrix')
+    def add_journey_matrix(self, matrix, names=None):
+        '''
+        Adds a 'journeyTime...' value for every destination and departure in a JourneyMatrix (or a path to its .npz file)
+        to every property in one pass. 'names' optionally maps destinations to names used in the column names.
+        '''
+        if isinstance(matrix, str):
+            matrix = JourneyMatrix.load(matrix)
+        df = self.listings.df
+        postcodes = df['postcodeEstimate'].fillna('') if 'postcodeEstimate' in df else [''] * len(df)
+        times = matrix.lookup(postcodes)
+        columns = matrix.column_names(names)
+        for j, destColumns in enumerate(columns):
+            for k, column in enumerate(destColumns):
+                df[column] = times[:, j, k]
+        missing = int(np.isnan(times).all(axis=(1, 2)).sum()) if len(df) else 0
+        return print('Rightmove: Added journey times for {} destinations ({} properties without any)'.format(len(matrix.destinations), missing))
+
+    @timed('rightmove.postprocess')
+    def postprocess(self, latlongDict, journeyTimes=None, destName='', propType=None, dropResults=['share', 'garage', 'retirement', 'park', 'multiple'], sectorFallback=False, workers=None):
+        '''
+        estimate_postcodes then add_journey_times (and cleaning, given 'propType') in one call.
+
+        With 'workers' (> 1) the listings are sharded by outcode across a process pool, each worker getting only its
+        outcodes' postcodes (from shared memory), and merged back in their original order, giving the same result as the
+        serial run. Postcodes are only estimated within each listing's own outcode.
+        '''
+        if journeyTimes is None:
+            tables = []
+        elif isinstance(journeyTimes, list):
+            tables = journeyTimes
+        else:
+            tables = [(journeyTimes, destName)]
+
+        if not workers or workers <= 1:
+            if propType is not None:
+                self._clean_results(propType, dropResults)
+            self.estimate_postcodes(latlongDict)
+            if tables:
+                self.add_journey_times(tables, sectorFallback=sectorFallback)
+            return
+
+        self.listings.df = postprocess_sharded(self, latlongDict, tables, propType, dropResults, sectorFallback, workers)
+        return print('Rightmove: Post-processed {} properties across {} workers'.format(len(self.listings), workers))
+
+    @timed('rightmove.join_travel_raster')
+    def add_travel_raster(self, raster, destName='', onlyMissing=False):
+        '''
+        Adds 'journeyTime'+destName to every property by interpolating a TravelTimeRaster (or the path to its .npy file)
+        at the property's own lat/long, so no postcode match is needed.
+        With 'onlyMissing' only properties without a value in that column yet (e.g. from add_journey_times) are filled.
+        '''
+        if isinstance(raster, str):
+            raster = TravelTimeRaster.load(raster)
+        df = self.listings.df
+        column = 'journeyTime' + destName.capitalize()
+        times = raster.query(df['latitude'].to_numpy(dtype=np.float64), df['longitude'].to_numpy(dtype=np.float64)).round(1) if len(df) else np.array([])
+        if onlyMissing and column in df:
+            filled = df[column].isna() & ~np.isnan(times)
+            df.loc[filled, column] = times[filled.to_numpy()]
+            added = int(filled.sum())
+        else:
+            df[column] = times
+            added = int((~np.isnan(times)).sum())
+        return print('Rightmove: {} added from travel raster for {} properties ({} outside it)'.format(column, added, int(np.isnan(times).sum())))
 
     def to_json(self, path, type:dict or list = dict):
+        '''
+        Paths ending in .ndjson/.jsonl (optionally .gz) are written one record per line: an {'location', 'info'} record per
+        location followed by an {'location', 'property'} record per property (just the property with type=list).
+        '''
+        if is_ndjson(path):
+            return self._to_ndjson(path, type)
         with open(path, 'w') as f:
             if type==dict:
                 json.dump(self.results, f, sort_keys=True)
@@ -171,28 +454,95 @@ class Rightmove(object):
             else:
                 print('Error: to_json only works with type dict or list')
 
-    def load_json(self, path):
-        with open(path, 'r') as JSON:
-            self.results = json.load(JSON)
+    def _to_ndjson(self, path, type):
+        '''
+        Streams the listings straight from the ListingStore, so the nested results are never built in memory.
+        '''
+        if type not in (dict, list):
+            return print('Error: to_json only works with type dict or list')
+        with NdjsonWriter(path) as writer:
+            if type==dict:
+                writer.write({'location': location, 'info': info} for location, info in self.listings.info.items())
+                writer.write({'location': prop.get('location'), 'property': prop} for prop in self.listings.iter_properties())
+            else:
+                writer.write(self.listings.iter_properties())
+
+    def load_json(self, path, chunkSize=5000):
+        '''
+        Loads results saved by to_json with either type (a list of properties is grouped by each one's 'location').
+        NDJSON files are read lazily, 'chunkSize' records at a time.
+        '''
+        if not is_ndjson(path):
+            with open(path, 'r') as JSON:
+                results = json.load(JSON)
+            if isinstance(results, list):
+                self.listings = ListingStore()
+                for location, properties in _by_location(results).items():
+                    self.listings.append(location, properties)
+            else:
+                self.results = results
+            return
+        self.listings = ListingStore()
+        for chunk in read_ndjson_chunks(path, chunkSize):
+            pages = {}
+            for record in chunk:
+                if 'info' in record:
+                    self.listings.info[record['location']] = record['info']
+                elif 'property' in record:
+                    pages.setdefault(record['location'], []).append(record['property'])
+                else:  # type=list: bare properties
+                    pages.setdefault(record.get('location'), []).append(record)
+            for location, properties in pages.items():
+                self.listings.append(location, properties)
 
     def get_df(self, clean=True):
-        df = pd.DataFrame(self.resultsList)
+        df = self.listings.df.copy(deep=False)
         if clean:
             df = self.clean_df(df)
         return df
 
+    def get_query(self, clean=True, **kwargs):
+        '''
+        ListingQuery over get_df(clean), for repeated filtering (see ListingQuery for the keyword arguments).
+        '''
+        return ListingQuery(self.get_df(clean), **kwargs)
+
     @staticmethod
     def clean_df(df):
         df.rename(columns={'autoEmailReasonType': 'listingStatus'}, inplace=True)
         df.dropna(subset=['price'], inplace=True)
         df.drop(df[df.commercial].index, inplace=True)
-        df.drop(columns=['commercial', 'dateShortlisted', 'hidden', 'letFurnishType', 'overseas', 'premiumDisplayStyle', 'saved', 'shouldShowPrice', 'showLettingFeesMessage', 'showMap', 'showStreetView', 'status', 'transactionTypeId', 'visible'], inplace=True)
+        df.drop(columns=['commercial', 'dateShortlisted', 'hidden', 'letFurnishType', 'overseas', 'premiumDisplayStyle', 'saved', 'shouldShowPrice', 'showLettingFeesMessage', 'showMap', 'showStreetView', 'status', 'transactionTypeId', 'visible'], inplace=True, errors='ignore')
         return df
  
+    @property
+    def results(self):
+        '''
+        Listings as the original nested {location: {'info', 'properties': [dict, ...]}} dict (built on each access).
+        '''
+        return self.listings.to_results()
+
+    @results.setter
+    def results(self, results):
+        self.listings = ListingStore.from_results(results)
+
     @property
     def resultsList(self):
         return [prop for resultDict in self.results.values() for prop in resultDict['properties']]
 
+def _by_location(properties):
+    '''
+    Groups property dicts by their 'location'.
+    '''
+    locations = {}
+    for prop in properties:
+        locations.setdefault(prop.get('location'), []).append(prop)
+    return locations
+
+def _is_success(result, status):
+    return isinstance(result, dict) and result.get('result') == 'SUCCESS'
+
+
 if __name__ == "__main__":
     from postcodes import Postcodes
 
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+
+PROP_TYPES = ('rent', 'sale')
+
+class SectorStats(object):
+    '''
+    Running per-postcode-sector and per-outcode price statistics for rent and sale listings.
+
+    Prices are counted in a histogram with log-spaced bins ('accuracy' relative width, covering minPrice to maxPrice),
+    so listings can be added and removed exactly and quantiles are within about 'accuracy' of the true value. Each
+    listing's contribution is kept in arrays sorted by identifier, so re-adding a listing (e.g. after a price change)
+    replaces it and an update only touches the changed listings' histograms. Saved to a compressed .npz file.
+    '''
+    def __init__(self, minPrice=50, maxPrice=5e7, accuracy=0.02):
+        self.edges = np.geomspace(minPrice, maxPrice, int(np.ceil(np.log(maxPrice / minPrice) / np.log1p(2 * accuracy))) + 1)
+        self.keys = []
+        self.rowOf = {}
+        self.hist = np.zeros((0, len(PROP_TYPES), len(self.edges) - 1), dtype=np.int32)
+        self.sums = np.zeros((0, len(PROP_TYPES)))
+        # every listing seen, sorted by identifier * 2 + propType code; removed listings are kept with a bin of -1
+        self.memberKeys = np.zeros(0, dtype=np.int64)
+        self.memberRows = np.zeros((0, 2), dtype=np.int32)  # sector row, outcode row
+        self.memberBins = np.zeros(0, dtype=np.int32)
+        self.memberPrices = np.zeros(0)
+        self.changed = set()
+
+    def __len__(self):
+        return int((self.memberBins >= 0).sum())
+
+    def _rows(self, keys):
+        '''
+        Row of each key, adding rows for new keys.
+        '''
+        rows = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = self.rowOf.get(key)
+            if row is None:
+                row = self.rowOf[key] = len(self.keys)
+                self.keys.append(key)
+            rows[i] = row
+        if len(self.keys) > len(self.hist):
+            grow = max(len(self.keys), 2 * len(self.hist)) - len(self.hist)
+            self.hist = np.concatenate([self.hist, np.zeros((grow,) + self.hist.shape[1:], dtype=self.hist.dtype)])
+            self.sums = np.concatenate([self.sums, np.zeros((grow, len(PROP_TYPES)))])
+        return rows
+
+    def _bins(self, prices):
+        return np.clip(np.searchsorted(self.edges, prices, side='right') - 1, 0, len(self.edges) - 2)
+
+    def add(self, df, propType):
+        '''
+        Adds (or replaces) 'propType' listings from 'df', which needs 'identifier', 'price' and 'postcodeSector' columns.
+        Listings without a price or sector are removed if they were counted before.
+        '''
+        t = PROP_TYPES.index(propType)
+        df = df[['identifier', 'price', 'postcodeSector']].drop_duplicates('identifier', keep='last')
+        self.remove(df['identifier'], propType)
+        df = df[df['price'].notna() & df['postcodeSector'].notna() & (df['price'] > 0)]
+        if not len(df):
+            return
+
+        codes, sectors = pd.factorize(df['postcodeSector'])
+        sectors = [str(sector) for sector in sectors.tolist()]
+        rows = np.column_stack([self._rows(sectors)[codes], self._rows([sector.split(' ')[0] for sector in sectors])[codes]])
+        prices = df['price'].to_numpy(dtype=np.float64)
+        bins = self._bins(prices)
+        self._apply(rows, t, bins, prices, 1)
+
+        keys = df['identifier'].to_numpy(dtype=np.int64) * 2 + t
+        at, seen = self._find(keys)
+        self.memberRows[at[seen]], self.memberBins[at[seen]], self.memberPrices[at[seen]] = rows[seen], bins[seen], prices[seen]
+
+        new = np.flatnonzero(~seen)
+        if len(new):
+            new = new[np.argsort(keys[new])]
+            at = np.searchsorted(self.memberKeys, keys[new])
+            at += np.arange(len(new))  # positions in the merged arrays
+            kept = np.ones(len(self.memberKeys) + len(new), dtype=bool)
+            kept[at] = False
+            self.memberKeys = _merge(self.memberKeys, kept, at, keys[new])
+            self.memberRows = _merge(self.memberRows, kept, at, rows[new])
+            self.memberBins = _merge(self.memberBins, kept, at, bins[new])
+            self.memberPrices = _merge(self.memberPrices, kept, at, prices[new])
+
+    def _find(self, keys):
+        '''
+        (positions, found) of member keys: where each key is (or would go) in memberKeys and whether it's there.
+        '''
+        at = np.searchsorted(self.memberKeys, keys)
+        if not len(self.memberKeys):
+            return at, np.zeros(len(keys), dtype=bool)
+        return at, (at < len(self.memberKeys)) & (self.memberKeys[np.minimum(at, len(self.memberKeys) - 1)] == keys)
+
+    def remove(self, identifiers, propType):
+        '''
+        Removes 'propType' listings by identifier; unknown identifiers are ignored.
+        '''
+        t = PROP_TYPES.index(propType)
+        at, found = self._find(np.unique(np.asarray(identifiers, dtype=np.int64) * 2 + t))
+        at = at[found]
+        at = at[self.memberBins[at] >= 0]
+        if not len(at):
+            return
+        self._apply(self.memberRows[at], t, self.memberBins[at], self.memberPrices[at], -1)
+        self.memberBins[at] = -1
+
+    def _apply(self, rows, t, bins, prices, sign):
+        '''
+        Adds (sign 1) or subtracts (-1) listings from their sector's and outcode's histograms and sums.
+        '''
+        for level in (0, 1):
+            np.add.at(self.hist, (rows[:, level], t, bins), sign)
+            np.add.at(self.sums, (rows[:, level], t), sign * prices)
+        self.changed.update(self.keys[row] for row in np.unique(rows))
+
+    def apply_deltas(self, deltas, df, propType):
+        '''
+        Applies a Rightmove.deltas dict (incremental search) using 'df' (e.g. Rightmove.get_df() after estimate_postcodes)
+        for the sectors of new and re-priced listings.
+        '''
+        self.remove(deltas['removed']['identifier'].tolist(), propType)
+        updated = pd.concat([deltas['new']['identifier'], deltas['priceChanges']['identifier']])
+        self.add(df[df['identifier'].isin(updated)], propType)
+
+    def table(self, level='sector', keys=None, quantiles=(0.25, 0.5, 0.75), rentPeriodsPerYear=12):
+        '''
+        DataFrame of count, mean and price quantiles per rent/sale for every sector (or 'outcode'), or just 'keys' (e.g.
+        the changed set), plus 'grossYield': median rent * rentPeriodsPerYear / median sale price.
+        '''
+        if keys is None:
+            keys = [key for key in self.keys if (' ' in key) == (level == 'sector')]
+        else:
+            keys = [key for key in keys if key in self.rowOf and (' ' in key) == (level == 'sector')]
+        rows = np.array([self.rowOf[key] for key in keys], dtype=np.int64)
+
+        columns = {}
+        medians = []
+        for t, propType in enumerate(PROP_TYPES):
+            hist = self.hist[rows, t]
+            cumulative = hist.cumsum(axis=1)
+            counts = cumulative[:, -1] if len(rows) else np.zeros(0, dtype=np.int64)
+            columns[propType + 'Count'] = counts
+            with np.errstate(invalid='ignore', divide='ignore'):
+                columns[propType + 'Mean'] = self.sums[rows, t] / counts
+            for q in quantiles:
+                columns['{}P{:g}'.format(propType, 100 * q)] = self._quantile(hist, cumulative, q)
+            medians.append(self._quantile(hist, cumulative, 0.5))
+        table = pd.DataFrame(columns, index=pd.Index(keys, name=level))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table['grossYield'] = medians[0] * rentPeriodsPerYear / medians[1]
+        return table
+
+    def _quantile(self, hist, cumulative, q):
+        '''
+        Quantile of each histogram row, interpolated geometrically within its bin (NaN for empty rows).
+        '''
+        result = np.full(len(hist), np.nan)
+        full = cumulative[:, -1] > 0 if len(hist) else np.zeros(0, dtype=bool)
+        if not full.any():
+            return result
+        hist, cumulative = hist[full], cumulative[full]
+        counts = cumulative[:, -1]
+        target = np.maximum(q * counts, 1e-9)
+        b = (cumulative < target[:, None]).sum(axis=1)
+        before = np.where(b > 0, cumulative[np.arange(len(b)), np.maximum(b - 1, 0)], 0)
+        fraction = (target - before) / hist[np.arange(len(b)), b]
+        result[full] = self.edges[b] * (self.edges[b + 1] / self.edges[b]) ** fraction
+        return result
+
+    def pop_changed(self, level='sector'):
+        '''
+        Returns the sectors (or outcodes) changed since the last call, for refreshing only those.
+        '''
+        changed = sorted(key for key in self.changed if (' ' in key) == (level == 'sector'))
+        self.changed -= set(changed)
+        return changed
+
+    def save(self, path):
+        n = len(self.keys)
+        kept = self.memberBins >= 0
+        np.savez_compressed(path, edges=self.edges, keys=np.array(self.keys, dtype=str), hist=self.hist[:n], sums=self.sums[:n],
+                            memberKeys=self.memberKeys[kept], memberRows=self.memberRows[kept], memberBins=self.memberBins[kept], memberPrices=self.memberPrices[kept])
+
+    @classmethod
+    def load(cls, path):
+        stats = cls.__new__(cls)
+        with np.load(path) as data:
+            for name in ('edges', 'hist', 'sums', 'memberKeys', 'memberRows', 'memberBins', 'memberPrices'):
+                setattr(stats, name, data[name])
+            stats.keys = data['keys'].tolist()
+        stats.rowOf = {key: row for row, key in enumerate(stats.keys)}
+        stats.changed = set()
+        return stats
+
+def _merge(array, kept, at, values):
+    '''
+    'array' with 'values' inserted at positions 'at' of the result ('kept' marks the other positions).
+    '''
+    merged = np.empty((len(kept),) + array.shape[1:], dtype=array.dtype)
+    merged[kept] = array
+    merged[at] = values
+    return merged
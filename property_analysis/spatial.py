@@ -0,0 +1,183 @@
+import numpy as np
+
+
+class NearestIndex(object):
+    '''
+    Uniform grid index over lat/long points for batched nearest-neighbour queries.
+
+    Distances are plain euclidean distances in degrees. Points can optionally be tagged with integer group codes
+    (e.g. one code per outcode) so that a query only matches points that share its group.
+    '''
+    def __init__(self, lats, lngs, groups=None, cellSize=0.002, chunkSize=20000):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.groups = np.zeros(len(self.lats), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+        self.cellSize = cellSize
+        self.chunkSize = chunkSize
+
+        cx, cy = self._cells(self.lats, self.lngs)
+        if len(self.lats):
+            self.cxMin, self.cyMin = cx.min() - 1, cy.min() - 1
+            self.nx, self.ny = cx.max() - self.cxMin + 2, cy.max() - self.cyMin + 2
+            self.nGroups = int(self.groups.max()) + 1
+        else:
+            self.cxMin = self.cyMin = 0
+            self.nx = self.ny = self.nGroups = 0
+
+        keys = self._keys(self.groups, cx, cy)
+        self.order = np.argsort(keys, kind='stable')
+        self.sortedKeys = keys[self.order]
+
+        self.groupOrder = np.argsort(self.groups, kind='stable')
+        self.sortedGroups = self.groups[self.groupOrder]
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _cells(self, lats, lngs):
+        return np.floor(lats / self.cellSize).astype(np.int64), np.floor(lngs / self.cellSize).astype(np.int64)
+
+    def _keys(self, groups, cx, cy):
+        '''
+        Combines group and cell coordinates into a single sortable key (-1 for cells outside the indexed area).
+        '''
+        cx = cx - self.cxMin
+        cy = cy - self.cyMin
+        valid = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny) & (groups >= 0) & (groups < self.nGroups)
+        keys = (groups * self.nx + cx) * self.ny + cy
+        keys[~valid] = -1
+        return keys
+
+    def query(self, lats, lngs, groups=None):
+        '''
+        Returns (distances, indices) of the nearest indexed point to each query point.
+
+        Queries with no point in their group, or a NaN/infinite lat/long, get a distance of inf and an index of -1.
+        Ties are resolved in favour of the point that was indexed first.
+        '''
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        groups = np.zeros(len(lats), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+
+        distances = np.full(len(lats), np.inf)
+        indices = np.full(len(lats), -1, dtype=np.int64)
+        if not len(self) or not len(lats):
+            return distances, indices
+
+        finite = np.flatnonzero(np.isfinite(lats) & np.isfinite(lngs))
+        for start in range(0, len(finite), self.chunkSize):
+            chunk = finite[start:start + self.chunkSize]
+            distances[chunk], indices[chunk] = self._query_grid(lats[chunk], lngs[chunk], groups[chunk])
+
+        # The 3x3 cell neighbourhood only guarantees the true nearest point when it lies within one cell width.
+        unresolved = finite[~(distances[finite] <= self.cellSize)]
+        if len(unresolved):
+            distances[unresolved], indices[unresolved] = self._query_brute(lats[unresolved], lngs[unresolved], groups[unresolved])
+        return distances, indices
+
+    def _query_grid(self, lats, lngs, groups):
+        n = len(lats)
+        best = np.full(n, np.inf)
+        bestIdx = np.full(n, -1, dtype=np.int64)
+        qx, qy = self._cells(lats, lngs)
+
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                keys = self._keys(groups, qx + dx, qy + dy)
+                starts = np.searchsorted(self.sortedKeys, keys, side='left')
+                ends = np.searchsorted(self.sortedKeys, keys, side='right')
+                counts = np.where(keys >= 0, ends - starts, 0)
+                total = counts.sum()
+                if not total:
+                    continue
+
+                queryRep = np.repeat(np.arange(n), counts)
+                offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+                candidates = self.order[np.repeat(starts, counts) + offsets]
+                self._update_best(best, bestIdx, queryRep, candidates, lats, lngs)
+        return best, bestIdx
+
+    def _query_brute(self, lats, lngs, groups):
+        best = np.full(len(lats), np.inf)
+        bestIdx = np.full(len(lats), -1, dtype=np.int64)
+        for group in np.unique(groups):
+            queries = np.flatnonzero(groups == group)
+            lo = np.searchsorted(self.sortedGroups, group, side='left')
+            hi = np.searchsorted(self.sortedGroups, group, side='right')
+            points = np.sort(self.groupOrder[lo:hi])
+            if not len(points):
+                continue
+            step = max(1, (self.chunkSize * 50) // len(points))
+            for start in range(0, len(queries), step):
+                q = queries[start:start + step]
+                d = np.hypot(lats[q, None] - self.lats[points], lngs[q, None] - self.lngs[points])
+                nearest = d.argmin(axis=1)  # argmin returns the first (lowest index) minimum
+                best[q] = d[np.arange(len(q)), nearest]
+                bestIdx[q] = points[nearest]
+        return best, bestIdx
+
+    def _update_best(self, best, bestIdx, queryRep, candidates, lats, lngs):
+        d = np.hypot(lats[queryRep] - self.lats[candidates], lngs[queryRep] - self.lngs[candidates])
+        order = np.lexsort((candidates, d, queryRep))
+        queryRep, candidates, d = queryRep[order], candidates[order], d[order]
+        first = np.r_[True, queryRep[1:] != queryRep[:-1]]
+        q, c, d = queryRep[first], candidates[first], d[first]
+        better = (d < best[q]) | ((d == best[q]) & (c < bestIdx[q]))
+        best[q[better]] = d[better]
+        bestIdx[q[better]] = c[better]
+
+
+EARTH_RADIUS = 6371008.8  # mean earth radius in metres
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    '''
+    Great-circle distance in metres between (arrays of) lat/long points, broadcasting like any NumPy ufunc.
+    '''
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2)**2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def k_nearest_haversine(lats, lngs, pointLats, pointLngs, k=1, radius=None, chunkSize=5000):
+    '''
+    Returns (distances, indices) arrays of shape (len(lats), k) for the k nearest points to each query, nearest first.
+
+    Distances are haversine metres. Neighbours further than 'radius' metres (or missing when there are fewer than k
+    points) get a distance of inf and an index of -1.
+    '''
+    queries = _unit_vectors(lats, lngs)
+    points = _unit_vectors(pointLats, pointLngs)
+
+    distances = np.full((len(queries), k), np.inf)
+    indices = np.full((len(queries), k), -1, dtype=np.int64)
+    kk = min(k, len(points))
+    if not kk:
+        return distances, indices
+
+    # On the unit sphere the nearest points have the largest dot product, so ranking is a single matrix multiply.
+    for start in range(0, len(queries), chunkSize):
+        chunk = slice(start, start + chunkSize)
+        similarity = queries[chunk] @ points.T
+        if kk < len(points):
+            nearest = np.argpartition(-similarity, kk - 1, axis=1)[:, :kk]
+        else:
+            nearest = np.broadcast_to(np.arange(kk), (similarity.shape[0], kk))
+        nearestS = np.take_along_axis(similarity, nearest, axis=1)
+        order = np.argsort(-nearestS, axis=1, kind='stable')
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        chord = np.linalg.norm(queries[chunk, None, :] - points[nearest], axis=2)
+        distances[chunk, :kk] = 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1))
+        indices[chunk, :kk] = nearest
+
+    if radius is not None:
+        outside = distances > radius
+        distances[outside] = np.inf
+        indices[outside] = -1
+    return distances, indices
+
+
+def _unit_vectors(lats, lngs):
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))
+    return np.column_stack((np.cos(lats) * np.cos(lngs), np.cos(lats) * np.sin(lngs), np.sin(lats)))
@@ -1,24 +1,104 @@
 import asyncio
 import json
+import os
+import time
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
-from .async_requests import AsyncRequests
+from .async_requests import AsyncClient, run_sync
+from .instrument import count, span, timed
+from .journey_tables import JourneyTables
+from .ndjson import NdjsonWriter, is_ndjson, read_ndjson
+from .postcode_store import lookup_latlongs
+from .request_planner import RequestPlan, plan_requests
+from .response_cache import ResponseCache
 
 
-class JourneyPlanner(object):
-    def __init__(self, app_id, app_key, rateLimit=0.13):
+class JourneyPlanner(AsyncClient):
+    '''
+    TfL journey planner. Every request method has an async version ('..._async') for use inside a running event loop;
+    'async with JourneyPlanner(...)' keeps one session open across requests, and an HttpPool 'pool' shares its
+    connection pool with other clients.
+    '''
+    def __init__(self, app_id, app_key, rateLimit=0.13, burst=1, maxInFlight=50, cache=None, cacheTtl=24*60*60, pool=None):
         self.url = 'https://api.tfl.gov.uk/'
 
         self.app_id = app_id
         self.app_key = app_key
         self.rateLimit = rateLimit  # max: 500 per minute (interval: 0.12 secs)
+        self.burst = burst
+        self.maxInFlight = maxInFlight
+        self.pool = pool
+        # path or ResponseCache; 'cacheTtl' covers responses without a recommendedMaxAgeMinutes
+        self.cache = ResponseCache(cache, ttl=cacheTtl) if isinstance(cache, str) else cache
+        self.results = {}
 
     def load_postcodes(self, postcodeDict):
         self.postcodeDict = postcodeDict
 
-    def request_journeys(self, endLocation, year, month, day, hour, modes=[], limit=None):
-        departDatetime = datetime(year=year, month=month, day=day, hour=hour, minute=00)
+    def _postcode_latlongs(self, limit=None):
+        '''
+        {postcode: (lat, long)} for the first 'limit' loaded postcodes, looked up in one go.
+        '''
+        postcodes = list(self.postcodeDict.keys())[:limit]
+        latlongs = lookup_latlongs(self.postcodeDict, postcodes).tolist()
+        return {postcode: tuple(latlong) for postcode, latlong in zip(postcodes, latlongs)}
+
+    def request_journeys(self, endLocation, year, month, day, hour, modes=[], limit=None, outPath=None, resultsType='postcodes', batchSize=1000, queueSize=1000, flushInterval=None, dedupe=True, approximate=None):
+        return run_sync(self.request_journeys_async(endLocation, year, month, day, hour, modes, limit, outPath, resultsType, batchSize, queueSize, flushInterval, dedupe, approximate), self.pool)
+
+    @timed('tfl.request_journeys')
+    async def request_journeys_async(self, endLocation, year, month, day, hour, modes=[], limit=None, outPath=None, resultsType='postcodes', batchSize=1000, queueSize=1000, flushInterval=None, dedupe=True, approximate=None):
+        '''
+        Requests journeys from every loaded postcode to 'endLocation', storing the raw TfL results in self.results.
+
+        With 'dedupe' postcodes sharing an exact lat/long are requested once and the result is shared between them.
+        With approximate='sector' or 'grid' only one lat/long per postcode sector / grid cell is requested and the other
+        postcodes' journey times are interpolated into self.approximations (see plan_requests).
+
+        With 'outPath' (.csv or .parquet) results are streamed instead: postcodes pass through a bounded queue, each result
+        is reduced straight away to its 'postcodes' or 'journeys' rows, and rows are appended to 'outPath' every
+        'batchSize' rows (and at least every 'flushInterval' seconds), so memory stays flat however many postcodes are requested.
+        An .ndjson/.jsonl(.gz) 'outPath' gets one JSON record per row instead, and with resultsType='results' the raw TfL
+        results as {'postcode', 'result'} records (readable with load_json / iter_json).
+        '''
+        params = self._journey_params(year, month, day, hour, modes)
+        latlongs = self._postcode_latlongs(limit)
+        if resultsType == 'results' and not (outPath and is_ndjson(outPath)):
+            raise Exception('request_journeys resultsType "results" needs an .ndjson/.jsonl "outPath"')
+        if approximate and resultsType != 'postcodes':
+            raise Exception('request_journeys "approximate" only works with resultsType "postcodes"')
+
+        if dedupe or approximate:
+            plan = plan_requests(latlongs, approximate=approximate)
+        else:
+            plan = RequestPlan({postcode: [postcode] for postcode in latlongs})
+        self.plan = plan
+        print('JourneyPlanner: Request plan:', plan)
+        self.approximations = {}
+
+        if outPath:
+            writer = NdjsonWriter(outPath, batchSize, flushInterval, append=True) if is_ndjson(outPath) else RowWriter(outPath, batchSize, flushInterval)
+            try:
+                async with self._session():
+                    self.streamed = await self._stream_journeys(plan, endLocation, params, writer, resultsType, queueSize)
+            finally:
+                writer.close()
+            return print(f'JourneyPlanner: Streamed {self.streamed} results to {outPath}.')
+
+        self.results = {}
+
+        async with self._session():
+            await asyncio.gather(*[self._store_journey(plan, rep, endLocation, params) for rep in plan.representatives])
+
+        if plan.approximated:
+            self.approximations = plan.interpolate({rep: postcode_row(rep, self.results[rep])['journeyTime'] for rep in plan.groups if rep in self.results})
+
+        return print(f'JourneyPlanner: Collected {len(self.results)} results ({len(self.approximations)} approximated).')
+
+    def _journey_params(self, year, month, day, hour, modes=[], minute=0):
+        departDatetime = datetime(year=year, month=month, day=day, hour=hour, minute=minute)
         if datetime.now() > departDatetime:
             raise Exception('Requested "departDatetime" is in the past')
         date = departDatetime.strftime('%Y%m%d')
@@ -37,37 +117,127 @@ class JourneyPlanner(object):
           params['mode'] = ','.join(modes)
           
         params.update({'app_id': self.app_id, 'app_key': self.app_key})
+        return params
 
-        self.results = {}
+    async def _stream_journeys(self, plan, endLocation, params, writer, resultsType, queueSize):
+        reduce = {'postcodes': lambda postcode, result: [postcode_row(postcode, result)], 'journeys': journey_rows,
+                  'results': lambda postcode, result: [{'postcode': postcode, 'result': result}]}[resultsType]
+        collected = 0
+        repTimes = {}
+        lastResult = None
+
+        async def handle(rep):
+            nonlocal collected, lastResult
+            result = await self._fetch_journey(rep, endLocation, params)
+            if result is not None:
+                for postcode in plan.groups[rep]:
+                    writer.write(reduce(postcode, member_result(result, rep, postcode)))
+                collected += len(plan.groups[rep])
+                if plan.approximated:
+                    repTimes[rep] = postcode_row(rep, result)['journeyTime']
+                    lastResult = result
+
+        await self._run_queue(plan.representatives, handle, queueSize)
+
+        if plan.approximated and lastResult is not None:
+            self.approximations = plan.interpolate(repTimes)
+            writer.write(approximation_rows(self.approximations, lastResult))
+            collected += len(self.approximations)
+        return collected
 
-        async def run(endLocation, params):
-            self.requests = AsyncRequests(rateLimit=self.rateLimit)
-            await asyncio.gather(*[asyncio.ensure_future(self._fetch_journey(postcode, endLocation, params)) for postcode in list(self.postcodeDict.keys())[:limit]])
-            await self.requests.close()
+    async def _run_queue(self, jobs, handle, queueSize=1000):
+        '''
+        Feeds 'jobs' through a bounded queue to a fixed pool of workers awaiting handle(job).
+        '''
+        queue = asyncio.Queue(maxsize=queueSize)
 
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(run(endLocation, params))
+        async def consume():
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                try:
+                    await handle(job)
+                except Exception as e:
+                    # one bad result mustn't kill the worker, or the queue would fill up and never drain
+                    print(f'Error: JourneyPlanner job {job} {type(e).__name__} {e.args}')
+                    count('tfl.failed')
 
-        return print(f'JourneyPlanner: Collected {len(self.results)} results.')
+        workers = [asyncio.ensure_future(consume()) for _ in range(self.maxInFlight or 50)]
+        for job in jobs:
+            await queue.put(job)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    def request_matrix(self, destinations, departures, modes=[], limit=None, outPath=None, queueSize=1000):
+        return run_sync(self.request_matrix_async(destinations, departures, modes, limit, outPath, queueSize), self.pool)
+
+    @timed('tfl.request_matrix')
+    async def request_matrix_async(self, destinations, departures, modes=[], limit=None, outPath=None, queueSize=1000):
+        '''
+        Requests the quickest journey time from every loaded postcode to every destination at every departure time
+        (datetimes), all through one shared rate-limited session, and returns them as a JourneyMatrix (also self.matrix).
+
+        With 'outPath' the matrix is saved as a compressed .npz file.
+        '''
+        latlongs = self._postcode_latlongs(limit)
+        postcodes = list(latlongs)
+        paramsList = [self._journey_params(dt.year, dt.month, dt.day, dt.hour, modes, minute=dt.minute) for dt in departures]
+        matrix = JourneyMatrix(postcodes, [str(destination) for destination in destinations], [dt.isoformat() for dt in departures])
+
+        # postcodes sharing an exact lat/long are requested once
+        self.plan = plan_requests(latlongs)
+        print('JourneyPlanner: Request plan:', self.plan)
+        rowIdx = {postcode: i for i, postcode in enumerate(postcodes)}
+        reps = self.plan.representatives
+        groupRows = [[rowIdx[postcode] for postcode in self.plan.groups[rep]] for rep in reps]
+
+        async def handle(job):
+            i, j, k = job
+            result = await self._fetch_journey(reps[i], matrix.destinations[j], paramsList[k])
+            if result is not None:
+                matrix.times[groupRows[i], j, k] = min(journey['duration'] for journey in result['journeys'])
+
+        async with self._session():
+            jobs = ((i, j, k) for i in range(len(reps)) for j in range(len(destinations)) for k in range(len(departures)))
+            await self._run_queue(jobs, handle, queueSize)
+
+        self.matrix = matrix
+        if outPath:
+            matrix.save(outPath)
+        print(f'JourneyPlanner: Collected {int(np.isfinite(matrix.times).sum())}/{matrix.times.size} journey times.')
+        return matrix
+
+    async def _store_journey(self, plan, startPostcode, endLocation, params):
+        result = await self._fetch_journey(startPostcode, endLocation, params)
+        if result is not None:
+            for postcode in plan.groups[startPostcode]:
+                self._results[postcode] = member_result(result, startPostcode, postcode)
+            self.resultsVersion += 1
 
     async def _fetch_journey(self, startPostcode, endLocation, params):
+        '''
+        Returns the TfL result for one postcode (retrying a 300 disambiguation with its lat/long), or None on failure.
+        '''
         url = f"{self.url}Journey/JourneyResults/{startPostcode}/to/{endLocation}"
         try:
-            result, status = await self.requests.fetch(url, params)
+            result, status = await self.requests.fetch(url, params, accept=_is_usable)
             if status == 200:
-                if 'journeys' in result:
-                    self.results[startPostcode] = result
-                    return print('Journey Planner: Fetched', startPostcode)
+                if _has_journeys(result):
+                    count('tfl.fetched')
+                    return result
                 else:
                     print(f'Error: _fetch_journey - {startPostcode} (Journey Planner failure)')
             elif status == 300:
                 startLatLong = self.postcodeDict[startPostcode]
                 url = "{}Journey/JourneyResults/{},{}/to/{}".format(
                     self.url, *startLatLong, endLocation)
-                result, status = await self.requests.fetch(url, params)
-                if 'journeys' in result: 
-                    self.results[startPostcode] = result
-                    return print('Journey Planner: Fetched', startPostcode, startLatLong)
+                result, status = await self.requests.fetch(url, params, accept=_is_usable)
+                count('tfl.disambiguated')
+                if _has_journeys(result):
+                    count('tfl.fetched')
+                    return result
                 else:
                     print(f'Warning: _fetch_journey - {startPostcode} (Journey Planner failure)')
             else:
@@ -76,8 +246,23 @@ class JourneyPlanner(object):
         except Exception as e:
             print(
                 f"Error: _fetch_journey {startPostcode} {type(e).__name__} {e.args}")
+        count('tfl.failed')
 
     def to_json(self, path, type: dict or list = dict):
+        '''
+        Paths ending in .ndjson/.jsonl (optionally .gz) are written one {'postcode', 'result'} record per line (one
+        postcodesList row per line with type=list).
+        '''
+        if is_ndjson(path):
+            if type == dict:
+                rows = ({'postcode': postcode, 'result': result} for postcode, result in self.results.items())
+            elif type == list:
+                rows = self.postcodesList
+            else:
+                raise Exception('to_json only works with type dict or list')
+            with NdjsonWriter(path) as writer:
+                writer.write(rows)
+            return
         with open(path, 'w') as f:
             if type == dict:
                 json.dump(self.results, f, sort_keys=True)
@@ -87,70 +272,305 @@ class JourneyPlanner(object):
                 raise Exception('to_json only works with type dict or list')
 
     def load_json(self, path):
+        if is_ndjson(path):
+            self.results = dict(self.iter_json(path))
+            return
         with open(path, 'r') as JSON:
             self.results = json.load(JSON)
 
-    def get_df(self, resultsType: 'postcodes' or 'journeys'):
+    @staticmethod
+    def iter_json(path):
+        '''
+        Lazily yields (postcode, result) from an NDJSON results file, e.g. one streamed by request_journeys.
+        '''
+        for record in read_ndjson(path):
+            yield record['postcode'], record['result']
+
+    def get_df(self, resultsType: 'postcodes' or 'journeys' or 'legs'):
+        '''
+        'postcodes': the quickest journey time per postcode (plus interpolated ones, flagged 'approximate').
+        'journeys': one row per journey option, with its number of 'legs'.
+        'legs': one row per leg of every journey option, with its 'mode' and 'duration'.
+        '''
+        tables = self.tables
         if resultsType == 'postcodes':
-            return pd.DataFrame(self.postcodesList).set_index('postcode', drop=True)
+            df = tables.postcodes.copy()
+            if getattr(self, 'approximations', None) and self.results:
+                df['approximate'] = False
+                approximated = pd.DataFrame(approximation_rows(self.approximations, next(iter(self.results.values())))).set_index('postcode', drop=True)
+                df = pd.concat([df, approximated.assign(approximate=True)])
+            return df
         elif resultsType == 'journeys':
-            return pd.DataFrame(self.journeysList).set_index(['postcode', 'journeyIdx'], drop=True)
+            return tables.journeys.copy()
+        elif resultsType == 'legs':
+            return tables.legs.copy()
         else:
             raise Exception('get_df "resultsType" incorrect')
 
+    @property
+    def results(self):
+        return self._results
+
+    @results.setter
+    def results(self, results):
+        self._results = results
+        self.resultsVersion = getattr(self, 'resultsVersion', 0) + 1
+
+    @property
+    def tables(self):
+        '''
+        JourneyTables extracted from self.results in one pass, cached until results change.
+        '''
+        key = (self.resultsVersion, len(self._results))
+        if getattr(self, '_tablesKey', None) != key:
+            with span('tfl.extract_tables', results=len(self._results)):
+                self._tables = JourneyTables.from_results(self._results)
+            self._tablesKey = key
+        return self._tables
+
     @property
     def postcodesList(self):
-        return [
-        {
+        return self.tables.postcodes.reset_index().to_dict('records')
+
+    @property
+    def journeysList(self):
+        return [row for postcode, result in self.results.items() for row in journey_rows(postcode, result)]
+
+def postcode_row(postcode, result):
+    '''
+    Reduces a raw TfL result to one row with the quickest journey time.
+    '''
+    return {
         'postcode': postcode, 
         'from': result['journeyVector']['from'], 
         'to': result['journeyVector']['to'], 
         'dateTime': result['searchCriteria']['dateTime'],
         'journeyTime': min([journey['duration'] for journey in result['journeys']])
-        } 
-        for postcode, result in self.results.items()]
+        }
 
-    @property
-    def journeysList(self):
-        return [
+def journey_rows(postcode, result):
+    '''
+    Reduces a raw TfL result to one row per journey option.
+    '''
+    return [
         {
         'postcode': postcode, 
         'from': result['journeyVector']['from'], 
         'to': result['journeyVector']['to'], 
         'dateTime': result['searchCriteria']['dateTime'], 
         'dateTimeType': result['searchCriteria']['dateTimeType'],
-        'journeyIdx': result['journeys'].index(journey),
+        'journeyIdx': journeyIdx,
         'duration': journey['duration'], 
         'legs': [{'mode': leg['mode']['name'], 'duration': leg['duration']} for leg in journey['legs']]
         } 
-        for postcode, result in self.results.items() for journey in result['journeys']]
+        for journeyIdx, journey in enumerate(result['journeys'])]
+
+def member_result(result, rep, postcode):
+    '''
+    The representative's result for another postcode of its lat/long group: a shallow copy whose journeyVector 'from'
+    is the member postcode (kept as is if it isn't the representative's, e.g. a lat/long after a disambiguation).
+    '''
+    if postcode == rep:
+        return result
+    journeyVector = dict(result.get('journeyVector', {}))
+    if journeyVector.get('from') == rep:
+        journeyVector['from'] = postcode
+    return {**result, 'journeyVector': journeyVector}
+
+def approximation_rows(approximations, sampleResult):
+    '''
+    Postcode rows for interpolated journey times, taking 'to' and 'dateTime' from any result of the same request.
+    '''
+    return [
+        {
+        'postcode': postcode,
+        'from': None,
+        'to': sampleResult['journeyVector']['to'],
+        'dateTime': sampleResult['searchCriteria']['dateTime'],
+        'journeyTime': journeyTime
+        }
+        for postcode, journeyTime in approximations.items()]
+
+class JourneyMatrix(object):
+    '''
+    Quickest journey times (minutes, NaN if missing) indexed by [postcode, destination, departure].
+    '''
+    def __init__(self, postcodes, destinations, departures, times=None):
+        self.postcodes = np.asarray(postcodes, dtype=str)
+        self.destinations = [str(destination) for destination in destinations]
+        self.departures = [str(departure) for departure in departures]
+        if times is None:
+            times = np.full((len(self.postcodes), len(self.destinations), len(self.departures)), np.nan, dtype=np.float32)
+        self.times = times
+        self._order = None
+
+    def save(self, path):
+        np.savez_compressed(path, times=self.times, postcodes=self.postcodes, destinations=np.asarray(self.destinations, dtype=str), departures=np.asarray(self.departures, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz['postcodes'], npz['destinations'].tolist(), npz['departures'].tolist(), npz['times'])
+
+    def lookup(self, postcodes):
+        '''
+        Returns an array of shape (len(postcodes), destinations, departures), NaN for unknown postcodes.
+        '''
+        if self._order is None:
+            self._order = np.argsort(self.postcodes, kind='stable')
+        postcodes = np.asarray(postcodes, dtype=str)
+        sortedPostcodes = self.postcodes[self._order]
+        pos = np.minimum(np.searchsorted(sortedPostcodes, postcodes), max(len(sortedPostcodes) - 1, 0))
+        found = (sortedPostcodes[pos] == postcodes) if len(sortedPostcodes) else np.zeros(len(postcodes), dtype=bool)
+        times = np.full((len(postcodes),) + self.times.shape[1:], np.nan, dtype=self.times.dtype)
+        times[found] = self.times[self._order[pos[found]]]
+        return times
+
+    def column_names(self, names=None):
+        '''
+        Returns the 'journeyTime...' column name for each (destination, departure), using optional display 'names' for
+        destinations and adding the departure time when there is more than one.
+        '''
+        names = names or {}
+        return [['journeyTime' + str(names.get(destination, destination)).capitalize() + (departure[11:16].replace(':', '') if len(self.departures) > 1 else '')
+                 for departure in self.departures] for destination in self.destinations]
 
-def journey_times_updater(csvPath, postcodeDict, tflKeysDict, destination, year, month, day, hour, modes=[]):
-    with open(csvPath, 'r') as f:
-        rows = f.readlines()
-    headers = rows.pop(0).rstrip().split(',')
-    colIdx = headers.index('postcode')
-    collectedPostcodes = {row.split(',')[colIdx] for row in rows}
+    def to_df(self, names=None):
+        '''
+        Wide DataFrame with one row per postcode and one column per destination and departure.
+        '''
+        columns = [name for row in self.column_names(names) for name in row]
+        return pd.DataFrame(self.times.reshape(len(self.postcodes), -1), index=pd.Index(self.postcodes, name='postcode'), columns=columns)
 
-    newPostcodeDict = {postcode: latlong for postcode, latlong in postcodeDict.items() if postcode not in collectedPostcodes}
+class RowWriter(object):
+    '''
+    Buffers rows (dicts) and appends them to a csv, or a parquet file if pyarrow is installed, every 'batchSize' rows
+    (and at least every 'flushInterval' seconds).
+
+    Rows appended to an existing csv follow its header. Nested values (e.g. journey legs) are stored as JSON strings.
+    A parquet file keeps one schema (an existing file's, or the first batch's) and is written to '<path>.tmp', after
+    copying any existing rows, then moved into place on close, as parquet only becomes readable once its footer is
+    written. Use csv or ndjson for checkpoints that survive a killed run.
+    '''
+    def __init__(self, path, batchSize=1000, flushInterval=None):
+        self.path = path
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.rows = []
+        self.written = 0
+        self.lastFlush = time.monotonic()
+        self._parquetWriter = None
+
+    def write(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.batchSize or (self.flushInterval is not None and time.monotonic() - self.lastFlush >= self.flushInterval):
+            self.flush()
+
+    def flush(self):
+        self.lastFlush = time.monotonic()
+        if not self.rows:
+            return
+        df = pd.DataFrame(self.rows)
+        for col in df.columns:
+            if df[col].map(lambda value: isinstance(value, (list, dict))).any():
+                df[col] = df[col].map(json.dumps)
+
+        if self.path.endswith('.parquet'):
+            self._write_parquet(df)
+        elif os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            header = pd.read_csv(self.path, nrows=0).columns
+            df.reindex(columns=header).to_csv(self.path, mode='a', header=False, index=False)
+        else:
+            df.to_csv(self.path, index=False)
+
+        self.written += len(self.rows)
+        self.rows = []
+
+    def _write_parquet(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._parquetWriter is None:
+            existing = pq.ParquetFile(self.path) if os.path.exists(self.path) and os.path.getsize(self.path) > 0 else None
+            if existing is not None:
+                self._schema = existing.schema_arrow
+            else:
+                self._schema = _parquet_schema(pa.Table.from_pandas(df, preserve_index=False).schema)
+            self._parquetWriter = pq.ParquetWriter(self.path + '.tmp', self._schema)
+            if existing is not None:
+                for batch in existing.iter_batches():
+                    self._parquetWriter.write_batch(batch)
+        for name in self._schema.names:
+            if name not in df:
+                df[name] = None
+        self._parquetWriter.write_table(pa.Table.from_pandas(df[self._schema.names], schema=self._schema, preserve_index=False))
+
+    def close(self):
+        self.flush()
+        if self._parquetWriter is not None:
+            self._parquetWriter.close()
+            self._parquetWriter = None
+            os.replace(self.path + '.tmp', self.path)
+
+def _parquet_schema(schema):
+    '''
+    Parquet schema for every batch, from the first one's: all-null columns become strings and ints become floats, so
+    later batches with values there (or NaN gaps, or interpolated journey times) still fit.
+    '''
+    import pyarrow as pa
+    fields = []
+    for field in schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_integer(field.type):
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    return pa.schema(fields)
+
+def journey_times_updater(csvPath, postcodeDict, tflKeysDict, destination, year, month, day, hour, modes=[], checkpointSize=200, checkpointSecs=60):
+    '''
+    Requests journey times for every postcode in 'postcodeDict' not yet in 'csvPath' (for this destination and departure
+    time) and appends them to the csv in checkpoints as they arrive, so a killed run resumes where it stopped.
+    '''
+    departure = datetime(year=year, month=month, day=day, hour=hour).isoformat()
+    collectedPostcodes = _collected_postcodes(csvPath, str(destination), departure)
+
+    newPostcodes = [postcode for postcode in postcodeDict if postcode not in collectedPostcodes]
+    newPostcodeDict = dict(zip(newPostcodes, map(tuple, lookup_latlongs(postcodeDict, newPostcodes).tolist())))
     print('Journey Planner: New postcodes:', len(newPostcodeDict))
+    if not newPostcodeDict:
+        return print('Journey Planner: No new (working) postcodes since last update.')
 
     jp = JourneyPlanner(app_id=tflKeysDict['app_id'], app_key=tflKeysDict['app_key'], rateLimit=0.14)
     jp.load_postcodes(newPostcodeDict)
-    jp.request_journeys(endLocation=destination, year=year, month=month, day=day, hour=hour, modes=modes, limit=None)
-    
-    if not jp.results:
-        return print('Journey Planner: No new (working) postcodes since last update.')
+    jp.request_journeys(endLocation=destination, year=year, month=month, day=day, hour=hour, modes=modes, limit=None,
+                        outPath=csvPath, batchSize=checkpointSize, flushInterval=checkpointSecs)
+    return print('Journey Planner: Postcodes added:', jp.streamed)
+
+def _collected_postcodes(csvPath, destination, departure):
+    '''
+    Returns the set of postcodes already in a journey times csv for this destination and departure time, reading only
+    the key columns (csvs without 'to'/'dateTime' columns are assumed to hold a single destination and time).
+    '''
+    if not os.path.exists(csvPath) or os.path.getsize(csvPath) == 0:
+        return set()
+    columns = pd.read_csv(csvPath, nrows=0).columns
+    keyColumns = [col for col in ('postcode', 'to', 'dateTime') if col in columns]
+    df = pd.read_csv(csvPath, usecols=keyColumns, dtype=str)
+    if 'to' in df:
+        df = df[df['to'] == destination]
+    if 'dateTime' in df:
+        df = df[df['dateTime'] == departure]
+    return set(df['postcode'])
+
+def _has_journeys(result):
+    return isinstance(result, dict) and bool(result.get('journeys'))
+
+def _is_usable(result, status):
+    '''
+    Whether a TfL response is worth caching: a result with journeys, or a disambiguation (retried with the lat/long).
+    '''
+    return status == 300 or _has_journeys(result)
 
-    oldDf = pd.read_csv(csvPath, index_col='postcode')
-    # try:
-    newDf = jp.get_df(resultsType='postcodes')
-    # except KeyError:
-    #     return print('No new (working) postcodes since last update.')
-    combinedDf = oldDf.append(newDf)
-    # print(combinedDf)
-    combinedDf.to_csv(csvPath)
-    return print('Journey Planner: Postcodes added:', len(newDf))
 
 if __name__ == "__main__":
     import json
@@ -179,4 +599,4 @@ if __name__ == "__main__":
     # pprint(jp.results['SW10 0JG']['recommendedMaxAgeMinutes'])
     # pprint(jp.results['SW10 0JG']['searchCriteria'])
     # pprint(jp.results['SW10 0JG']['stopMessages'])
-    # pprint(jp.results['SW10 0JG']['journeys'][0].keys())
\ No newline at end of file
+    # pprint(jp.results['SW10 0JG']['journeys'][0].keys())
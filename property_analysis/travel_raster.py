@@ -0,0 +1,155 @@
+import json
+import numpy as np
+import pandas as pd
+
+from .postcode_store import lookup_latlongs
+from .spatial import EARTH_RADIUS
+
+class TravelTimeRaster(object):
+    '''
+    Journey times (minutes, NaN where unknown) on a regular lat/long grid, so the journey time from any coordinate can
+    be looked up by bilinear interpolation without a postcode match.
+
+    Grid node [i, j] is at (lat0 + i*dLat, lng0 + j*dLng). Saved as a .npy array (memory-mapped on load) plus a
+    '.json' sidecar with the grid and any metadata (e.g. destination and departure time).
+    '''
+    def __init__(self, times, lat0, lng0, dLat, dLng, meta=None):
+        self.times = times
+        self.lat0 = float(lat0)
+        self.lng0 = float(lng0)
+        self.dLat = float(dLat)
+        self.dLng = float(dLng)
+        self.meta = meta or {}
+
+    @property
+    def shape(self):
+        return self.times.shape
+
+    @property
+    def extent(self):
+        '''
+        (west, east, south, north) of the grid nodes, e.g. for matplotlib imshow(..., origin='lower', extent=extent).
+        '''
+        return (self.lng0, self.lng0 + (self.shape[1] - 1) * self.dLng, self.lat0, self.lat0 + (self.shape[0] - 1) * self.dLat)
+
+    @classmethod
+    def from_points(cls, lats, lngs, times, cellSize=200, maxDistance=1000, meta=None):
+        '''
+        Builds a raster with 'cellSize' metre cells from journey times at scattered points (e.g. postcodes).
+
+        Each node gets the mean time of the points nearest to it; nodes without points are filled from their
+        neighbours, out to 'maxDistance' metres from the nearest point, and are NaN beyond that.
+        '''
+        lats, lngs, times = (np.asarray(values, dtype=np.float64) for values in (lats, lngs, times))
+        known = np.isfinite(lats) & np.isfinite(lngs) & np.isfinite(times)
+        lats, lngs, times = lats[known], lngs[known], times[known]
+        if not len(times):
+            raise Exception('TravelTimeRaster needs at least one point with a journey time')
+
+        dLat = np.degrees(cellSize / EARTH_RADIUS)
+        dLng = dLat / np.cos(np.radians(lats.mean()))
+        margin = int(np.ceil(maxDistance / cellSize))
+        lat0 = (np.floor(lats.min() / dLat) - margin) * dLat
+        lng0 = (np.floor(lngs.min() / dLng) - margin) * dLng
+        rows = int(np.round((lats.max() - lat0) / dLat)) + margin + 1
+        cols = int(np.round((lngs.max() - lng0) / dLng)) + margin + 1
+
+        i = np.round((lats - lat0) / dLat).astype(np.int64)
+        j = np.round((lngs - lng0) / dLng).astype(np.int64)
+        cells = i * cols + j
+        totals = np.bincount(cells, weights=times, minlength=rows * cols)
+        counts = np.bincount(cells, minlength=rows * cols)
+        with np.errstate(invalid='ignore'):
+            grid = (totals / counts).reshape(rows, cols)
+
+        for _ in range(margin):
+            grid = _fill_from_neighbours(grid)
+        return cls(grid.astype(np.float32), lat0, lng0, dLat, dLng, meta)
+
+    @classmethod
+    def from_journey_times(cls, journeyTimes, postcodeDict, cellSize=200, maxDistance=1000, meta=None):
+        '''
+        Builds a raster from a postcode-indexed journeyTime Series, a DataFrame with 'postcode'/'journeyTime' columns (e.g.
+        JourneyPlanner.get_df('postcodes')) or a csv of them, placing postcodes with 'postcodeDict' (postcode -> lat/long).
+        '''
+        if isinstance(journeyTimes, str):
+            journeyTimes = pd.read_csv(journeyTimes, usecols=['postcode', 'journeyTime'])
+        if isinstance(journeyTimes, pd.DataFrame):
+            journeyTimes = journeyTimes.set_index('postcode')['journeyTime'] if 'postcode' in journeyTimes.columns else journeyTimes['journeyTime']
+        journeyTimes = journeyTimes.dropna()
+        latlongs = lookup_latlongs(postcodeDict, journeyTimes.index)
+        return cls.from_points(latlongs[:, 0], latlongs[:, 1], journeyTimes.to_numpy(dtype=np.float64), cellSize, maxDistance, meta)
+
+    def query(self, lats, lngs):
+        '''
+        Returns bilinearly interpolated journey times at each lat/long (NaN outside the raster or where all four
+        surrounding nodes are unknown; unknown nodes are left out of the weighting).
+        '''
+        y = (np.asarray(lats, dtype=np.float64) - self.lat0) / self.dLat
+        x = (np.asarray(lngs, dtype=np.float64) - self.lng0) / self.dLng
+        rows, cols = self.shape
+        inside = (y >= 0) & (y <= rows - 1) & (x >= 0) & (x <= cols - 1)
+
+        i = np.clip(np.floor(np.where(inside, y, 0)).astype(np.int64), 0, max(rows - 2, 0))
+        j = np.clip(np.floor(np.where(inside, x, 0)).astype(np.int64), 0, max(cols - 2, 0))
+        fy, fx = np.where(inside, y - i, 0), np.where(inside, x - j, 0)
+        i1, j1 = np.minimum(i + 1, rows - 1), np.minimum(j + 1, cols - 1)
+
+        total = np.zeros(len(y))
+        weights = np.zeros(len(y))
+        for values, weight in ((self.times[i, j], (1 - fy) * (1 - fx)), (self.times[i, j1], (1 - fy) * fx),
+                               (self.times[i1, j], fy * (1 - fx)), (self.times[i1, j1], fy * fx)):
+            known = np.isfinite(values)
+            total += np.where(known, values, 0) * weight
+            weights += np.where(known, weight, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = total / weights
+        result[~inside | (weights <= 0)] = np.nan
+        return result
+
+    def isochrone(self, minutes):
+        '''
+        Boolean grid of the nodes reachable within 'minutes' (see 'extent' for drawing it).
+        '''
+        with np.errstate(invalid='ignore'):
+            return np.asarray(self.times) <= minutes
+
+    def save(self, path):
+        '''
+        Saves the grid to 'path' (.npy) and its sidecar to 'path' + '.json'.
+        '''
+        np.save(path, np.asarray(self.times, dtype=np.float32))
+        with open(_npy_path(path) + '.json', 'w') as f:
+            json.dump({'lat0': self.lat0, 'lng0': self.lng0, 'dLat': self.dLat, 'dLng': self.dLng, 'shape': list(self.shape), 'meta': self.meta}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        path = _npy_path(path)
+        with open(path + '.json') as f:
+            sidecar = json.load(f)
+        times = np.load(path, mmap_mode='r' if mmap else None)
+        return cls(times, sidecar['lat0'], sidecar['lng0'], sidecar['dLat'], sidecar['dLng'], sidecar.get('meta'))
+
+def _npy_path(path):
+    return path if path.endswith('.npy') else path + '.npy'
+
+def _fill_from_neighbours(grid):
+    '''
+    Sets each unknown node with known neighbours (of 8) to their mean.
+    '''
+    padded = np.pad(grid, 1, constant_values=np.nan)
+    rows, cols = grid.shape
+    total = np.zeros_like(grid)
+    counts = np.zeros(grid.shape, dtype=np.int64)
+    for di in (0, 1, 2):
+        for dj in (0, 1, 2):
+            if di == 1 and dj == 1:
+                continue
+            neighbour = padded[di:di + rows, dj:dj + cols]
+            known = np.isfinite(neighbour)
+            total += np.where(known, neighbour, 0)
+            counts += known
+    fill = np.isnan(grid) & (counts > 0)
+    grid = grid.copy()
+    grid[fill] = total[fill] / counts[fill]
+    return grid
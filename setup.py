@@ -16,5 +16,5 @@ setup(
     license=license,
     packages=find_packages(exclude=('tests', 'docs')),
     include_package_data=True,
-    install_requires=['pandas', 'aiohttp']
+    install_requires=['numpy', 'pandas', 'aiohttp']
 )
\ No newline at end of file
@@ -0,0 +1,60 @@
+from context import property_analysis
+from replay_server import ReplayServer
+
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Offline throughput benchmark for Rightmove and JourneyPlanner against the local replay server (no network or API keys).
+# Memory is the tracemalloc peak while collecting, which also slows the clients' Python code down a little.
+
+random.seed(0)
+letters = 'ABDEFGHJLNPQRSTUWXYZ'
+postcodeDict = {}
+for i in range(2000):
+    lat, lng = round(51.3 + random.random() * 0.4, 6), round(-0.5 + random.random() * 0.7, 6)
+    postcodeDict['X{} {}{}{}'.format(i // 100, i % 10, letters[(i // 10) % 20], letters[i % 20])] = (lat, lng)
+departure = datetime.now() + timedelta(days=7)
+
+scenarios = [
+    ('clean', {}),
+    ('latency 100ms', {'latency': 0.1, 'jitter': 0.05}),
+    ('5% errors', {'errorRate': 0.05}),
+    ('2% 429s', {'throttleRate': 0.02, 'retryAfter': 0.5}),
+    ('10% disambiguation', {'disambiguationRate': 0.1}),
+]
+
+
+def measure(client, collect):
+    tracemalloc.start()
+    start = time.monotonic()
+    collect()
+    elapsed = time.monotonic() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stats = client.requests.stats()
+    return elapsed, peak, stats
+
+
+def report(name, client, elapsed, peak, stats):
+    print('{:<22} {:<14} {:>6} req {:>7.1f} req/s  p50 {:>6.1f} ms  p99 {:>6.1f} ms  {:>6.1f} MB peak  {:>4} retries  {:>3} throttled  {:>3} failed  {:.1f} secs'.format(
+        name, client, stats['requests'], stats['requests'] / elapsed, 1000 * (stats['latencyP50'] or 0), 1000 * (stats['latencyP99'] or 0),
+        peak / 1e6, stats['retries'], stats['throttled'], stats['failures'], elapsed))
+
+
+for name, settings in scenarios:
+    server = ReplayServer(**settings)
+    url = server.serve_in_thread()
+
+    rm = property_analysis.Rightmove(['E1*', 'N1*'], rateLimit=0.002, burst=10, maxInFlight=50)
+    rm.url = url + 'api/'
+    report(name, 'Rightmove', *measure(rm, lambda: rm.search_properties('rent', {'propertyTypes': 'flat,terraced,semi-detached'})))
+
+    jp = property_analysis.JourneyPlanner('', '', rateLimit=0.002, burst=10, maxInFlight=50)
+    jp.url = url
+    jp.load_postcodes(postcodeDict)
+    report(name, 'JourneyPlanner', *measure(jp, lambda: jp.request_journeys('1000013', departure.year, departure.month, departure.day, 8, dedupe=False)))
+
+    print('{:<22} server: {}'.format('', server.counts))
+    server.stop_thread()
@@ -0,0 +1,70 @@
+from context import property_analysis
+
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+# Synthetic raw TfL results (a few journeys with several legs and stop points each, ~20 KB per postcode).
+random.seed(0)
+modes = ('walking', 'bus', 'tube', 'overground', 'national-rail')
+
+
+def fake_result(postcode):
+    journeys = []
+    for _ in range(3):
+        legs = []
+        for _ in range(random.randint(2, 5)):
+            stops = [{'id': '940GZZLU{:04d}'.format(random.randint(0, 9999)), 'name': 'Stop {}'.format(random.randint(0, 999)),
+                      'lat': 51.3 + random.random() * 0.4, 'lon': -0.5 + random.random() * 0.7} for _ in range(random.randint(5, 25))]
+            legs.append({'duration': random.randint(1, 30), 'mode': {'id': random.choice(modes), 'name': random.choice(modes)},
+                         'instruction': {'summary': 'Continue along the route ' * 3, 'detailed': 'Walk to the stop ' * 5},
+                         'path': {'stopPoints': stops, 'lineString': '[' + ','.join('[51.5,-0.1]' for _ in range(60)) + ']'}})
+        journeys.append({'duration': sum(leg['duration'] for leg in legs), 'startDateTime': '2027-01-04T08:00:00',
+                         'arrivalDateTime': '2027-01-04T09:00:00', 'legs': legs})
+    return {'$type': 'Tfl.Api.Presentation.Entities.JourneyPlanner.ItineraryResult', 'journeys': journeys,
+            'journeyVector': {'from': postcode, 'to': '1000235', 'via': '', 'uri': '/journey/journeyresults/' + postcode},
+            'searchCriteria': {'dateTime': '2027-01-04T08:00:00', 'dateTimeType': 'Departing'}, 'recommendedMaxAgeMinutes': 60}
+
+
+n = 2000
+postcodes = ['X{} {}AA'.format(i // 10, i % 10) for i in range(n)]
+results = {postcode: fake_result(postcode) for postcode in postcodes}
+
+jp = property_analysis.JourneyPlanner('', '')
+jp.results = results
+directory = tempfile.mkdtemp()
+print('{} postcodes, NDJSON backend: {}'.format(n, 'orjson' if property_analysis.ndjson.orjson else 'json'))
+
+for name in ('results.json', 'results.ndjson', 'results.ndjson.gz'):
+    path = os.path.join(directory, name)
+    start = time.monotonic()
+    jp.to_json(path)
+    writeTime = time.monotonic() - start
+
+    loader = property_analysis.JourneyPlanner('', '')
+    tracemalloc.start()
+    start = time.monotonic()
+    loader.load_json(path)
+    loadTime = time.monotonic() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert len(loader.results) == n
+
+    if name == 'results.json':
+        streamTime, streamPeak = None, None
+    else:
+        tracemalloc.start()
+        start = time.monotonic()
+        for postcode, result in loader.iter_json(path):
+            result['journeys'][0]['duration']
+        streamTime = time.monotonic() - start
+        streamPeak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    del loader
+
+    print('{}: {:.1f} MB on disk, written in {:.2f} secs, loaded in {:.2f} secs ({:.0f} MB peak){}'.format(
+        name, os.path.getsize(path) / 1e6, writeTime, loadTime, peak / 1e6,
+        '' if streamTime is None else ', streamed in {:.2f} secs ({:.1f} MB peak)'.format(streamTime, streamPeak / 1e6)))
+    os.remove(path)
@@ -0,0 +1,48 @@
+from context import property_analysis
+
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# Serial vs sharded Rightmove post-processing (clean, estimate_postcodes, add_journey_times) on synthetic listings,
+# from 1 worker up to every core. Each run starts from the same listings and must give the same DataFrame.
+
+LISTINGS = 500000
+POSTCODES_PER_OUTCODE = 2000
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    outcodes = ['{}{}'.format(area, i) for area in ('E', 'N', 'SE', 'SW', 'W', 'NW') for i in range(1, 21)]
+    centres = {outcode: (51.3 + rng.random() * 0.4, -0.5 + rng.random() * 0.7) for outcode in outcodes}
+
+    postcodes, lats, lngs = [], [], []
+    for outcode in outcodes:
+        lat, lng = centres[outcode]
+        for i in range(POSTCODES_PER_OUTCODE):
+            postcodes.append('{} {}{}{}'.format(outcode, i % 10, chr(65 + (i // 10) % 26), chr(65 + i // 260)))
+            lats.append(lat + rng.random() * 0.02)
+            lngs.append(lng + rng.random() * 0.02)
+    store = property_analysis.PostcodeStore(postcodes, lats, lngs)
+    journeyTimes = pd.Series(rng.integers(10, 90, len(postcodes)).astype(float), index=postcodes)[::3]
+
+    locations = rng.choice(outcodes, LISTINGS)
+    origins = np.array([centres[location] for location in locations])
+    listings = pd.DataFrame({'identifier': np.arange(LISTINGS), 'location': locations,
+                             'latitude': origins[:, 0] + rng.random(LISTINGS) * 0.02, 'longitude': origins[:, 1] + rng.random(LISTINGS) * 0.02,
+                             'propertyType': rng.choice(['flat', 'terraced', 'park home'], LISTINGS), 'price': rng.integers(800, 4000, LISTINGS)})
+
+    cores = os.cpu_count() or 1
+    workerCounts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    baseline = None
+    for workers in workerCounts:
+        rm = property_analysis.Rightmove(outcodes)
+        rm.listings.df = listings.copy()
+        start = time.monotonic()
+        rm.postprocess(store.latlongs, journeyTimes, 'bank', propType='rent', sectorFallback=True, workers=workers)
+        elapsed = time.monotonic() - start
+        if baseline is None:
+            baseline, expected = elapsed, rm.listings.df
+        else:
+            pd.testing.assert_frame_equal(rm.listings.df, expected)
+        print('{:>2} workers: {:>6.2f} secs  {:>4.2f}x'.format(workers, elapsed, baseline / elapsed))
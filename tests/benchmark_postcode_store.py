@@ -0,0 +1,62 @@
+from context import property_analysis
+
+import random
+import time
+import tracemalloc
+
+import numpy as np
+
+# Synthetic London-sized postcode directory (~180k postcodes, several per lat/long), so no download is needed.
+random.seed(0)
+letters = 'ABDEFGHJLNPQRSTUWXYZ'
+postcodes, lats, lngs = [], [], []
+for outcodeNum in range(600):
+    outcode = 'X{}'.format(outcodeNum)
+    for i in range(300):
+        if i % 3 == 0:
+            lat, lng = round(51.3 + random.random() * 0.4, 6), round(-0.5 + random.random() * 0.7, 6)
+        postcodes.append('{} {}{}{}'.format(outcode, i % 10, letters[(i // 20) % 20], letters[i % 20]))
+        lats.append(lat)
+        lngs.append(lng)
+lats, lngs = np.array(lats), np.array(lngs)
+
+
+def build_dicts():
+    postcodeDict = {postcode: (lat, lon) for postcode, lat, lon in zip(postcodes, lats.tolist(), lngs.tolist())}
+    latlongDict = {}
+    for postcode, latlong in postcodeDict.items():
+        if latlong in latlongDict:
+            latlongDict[latlong].append(postcode)
+        else:
+            latlongDict[latlong] = [postcode]
+    return postcodeDict, latlongDict
+
+
+def build_store():
+    store = property_analysis.PostcodeStore(postcodes, lats, lngs)
+    return store, store.latlongs
+
+
+for name, build in (('dicts', build_dicts), ('store', build_store)):
+    tracemalloc.start()
+    start = time.monotonic()
+    postcodeDict, latlongDict = build()
+    buildTime = time.monotonic() - start
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    sample = random.sample(postcodes, 10000)
+    start = time.monotonic()
+    for postcode in sample:
+        latlong = postcodeDict[postcode]
+        latlongDict[latlong]
+    lookupTime = time.monotonic() - start
+
+    # bulk lookup, as the TfL and raster callers do
+    start = time.monotonic()
+    property_analysis.lookup_latlongs(postcodeDict, sample)
+    bulkTime = time.monotonic() - start
+
+    print('{}: {} postcodes, {} lat/longs, {:.1f} MB retained, built in {:.2f} secs, 10k lookups in {:.3f} secs ({:.3f} secs in bulk)'.format(
+        name, len(postcodeDict), len(latlongDict), retained / 1e6, buildTime, lookupTime, bulkTime))
+    del postcodeDict, latlongDict
@@ -0,0 +1,62 @@
+from context import property_analysis
+from property_analysis import Between, IsIn, Within
+
+import time
+import numpy as np
+import pandas as pd
+
+# ListingQuery vs boolean-mask pandas filtering for dashboard-style queries over synthetic listings.
+
+LISTINGS = 150000
+QUERIES = 1000
+
+rng = np.random.default_rng(0)
+sectors = np.array(['{}{} {}'.format(area, i, j) for area in ('E', 'N', 'SE', 'SW', 'W', 'NW') for i in range(1, 21) for j in range(10)])
+df = pd.DataFrame({
+    'price': rng.integers(500, 5000, LISTINGS).astype(float), 'bedrooms': rng.integers(0, 5, LISTINGS),
+    'latitude': 51.2 + rng.random(LISTINGS) * 0.6, 'longitude': -0.6 + rng.random(LISTINGS) * 1.0,
+    'journeyTimeBank': rng.integers(5, 90, LISTINGS).astype(float), 'stationDistance': rng.random(LISTINGS) * 3,
+    'postcodeSector': rng.choice(sectors, LISTINGS)})
+
+queries = []
+for i in range(QUERIES):
+    lo = float(rng.integers(500, 4500))
+    query = Between('price', lo, lo + 250) & Between('bedrooms', 1, 2) & Between('journeyTimeBank', None, float(rng.integers(20, 60)))
+    if i % 2:
+        lat, lng = 51.3 + rng.random() * 0.4, -0.4 + rng.random() * 0.6
+        query = query & Within(lat, lng, lat + 0.05, lng + 0.08)
+    else:
+        query = query & IsIn('postcodeSector', list(rng.choice(sectors, 5))) & Between('stationDistance', None, 1.0)
+    queries.append(query)
+
+start = time.monotonic()
+engine = property_analysis.ListingQuery(df, index=['price', 'bedrooms', 'journeyTimeBank', 'stationDistance', 'postcodeSector'])
+engine.grid
+print('Indexes built in {:.1f} ms'.format(1000 * (time.monotonic() - start)))
+
+for name in ('cold', 'cached'):
+    start = time.monotonic()
+    for query in queries:
+        engine.positions(query)
+    print('ListingQuery {:<7} {:>8.3f} ms/query'.format(name, 1000 * (time.monotonic() - start) / QUERIES))
+
+def pandas_mask(query):
+    mask = np.ones(len(df), dtype=bool)
+    for f in query.filters:
+        if isinstance(f, Between):
+            values = df[f.column]
+            mask &= values.notna().to_numpy()
+            if f.lo is not None:
+                mask &= (values >= f.lo).to_numpy()
+            if f.hi is not None:
+                mask &= (values <= f.hi).to_numpy()
+        elif isinstance(f, IsIn):
+            mask &= df[f.column].isin(f.values).to_numpy()
+        else:
+            mask &= ((df.latitude >= f.south) & (df.latitude <= f.north) & (df.longitude >= f.west) & (df.longitude <= f.east)).to_numpy()
+    return mask
+
+start = time.monotonic()
+for query in queries[:100]:
+    assert np.array_equal(np.flatnonzero(pandas_mask(query)), engine.positions(query))
+print('pandas masks        {:>8.3f} ms/query'.format(1000 * (time.monotonic() - start) / 100))
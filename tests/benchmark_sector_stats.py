@@ -0,0 +1,50 @@
+from context import property_analysis
+
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# SectorStats incremental refresh vs recomputing pandas groupbys over every listing, for a day's worth of changes.
+
+RENT, SALE, CHANGES = 300000, 200000, 2000
+
+rng = np.random.default_rng(0)
+sectors = np.array(['{}{} {}'.format(area, i, j) for area in ('E', 'N', 'SE', 'SW', 'W', 'NW') for i in range(1, 21) for j in range(10)])
+
+def listings(n, start, lo, hi):
+    return pd.DataFrame({'identifier': np.arange(start, start + n), 'price': np.round(np.exp(rng.uniform(np.log(lo), np.log(hi), n))),
+                         'postcodeSector': rng.choice(sectors, n)})
+
+rent, sale = listings(RENT, 0, 800, 6000), listings(SALE, 10**8, 150000, 3e6)
+
+start = time.monotonic()
+stats = property_analysis.SectorStats()
+stats.add(rent, 'rent')
+stats.add(sale, 'sale')
+stats.pop_changed()
+print('Initial build:        {:>8.1f} ms'.format(1000 * (time.monotonic() - start)))
+
+removed = rent['identifier'].sample(CHANGES, random_state=1)
+repriced = rent[~rent['identifier'].isin(removed)].sample(CHANGES, random_state=2).assign(price=lambda df: df['price'] * 0.95)
+new = listings(CHANGES, 10**9, 800, 6000)
+current = pd.concat([rent[~rent['identifier'].isin(removed) & ~rent['identifier'].isin(repriced['identifier'])], repriced, new])
+deltas = {'removed': pd.DataFrame({'identifier': removed}), 'new': new[['identifier']], 'priceChanges': repriced[['identifier']]}
+
+start = time.monotonic()
+stats.apply_deltas(deltas, current, 'rent')
+changed = stats.pop_changed()
+stats.table(keys=changed)
+print('Incremental refresh:  {:>8.1f} ms  ({} sectors changed)'.format(1000 * (time.monotonic() - start), len(changed)))
+
+start = time.monotonic()
+medians = {propType: df.groupby('postcodeSector')['price'].agg(['count', 'mean', 'median']) for propType, df in (('rent', current), ('sale', sale))}
+(medians['rent']['median'] * 12 / medians['sale']['median'])
+print('pandas full groupby:  {:>8.1f} ms'.format(1000 * (time.monotonic() - start)))
+
+path = os.path.join(tempfile.mkdtemp(), 'sector_stats.npz')
+stats.save(path)
+start = time.monotonic()
+property_analysis.SectorStats.load(path)
+print('Saved {:.1f} MB, loaded in {:.1f} ms'.format(os.path.getsize(path) / 1e6, 1000 * (time.monotonic() - start)))
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import zlib
+
+from aiohttp import web
+
+# Local stand-in for the Rightmove '/find' and TfL 'JourneyResults' APIs, so the clients can be benchmarked offline.
+# Replays recorded results (Rightmove.to_json / JourneyPlanner.to_json dicts) where given, otherwise synthetic payloads.
+
+OUTCODES_JSON = os.path.join(os.path.dirname(__file__), '..', 'property_analysis', 'rightmove_outcodes.json')
+
+
+class ReplayServer(object):
+    '''
+    'latency' (+ up to 'jitter') seconds per response; 'errorRate' of responses are 500s and 'throttleRate' are 429s
+    with a 'retryAfter' header. 'disambiguationRate' of TfL postcodes get a 300 (their lat/long then succeeds).
+    '''
+    def __init__(self, latency=0.02, jitter=0.01, errorRate=0.0, throttleRate=0.0, retryAfter=1, disambiguationRate=0.0,
+                 propertiesPerOutcode=(0, 400), rightmoveResults=None, tflResults=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.throttleRate = throttleRate
+        self.retryAfter = retryAfter
+        self.disambiguationRate = disambiguationRate
+        self.propertiesPerOutcode = propertiesPerOutcode
+        self.rightmoveResults = rightmoveResults or {}
+        self.tflResults = tflResults or {}
+        self.random = random.Random(seed)
+        self.counts = {'requests': 0, 'errors': 0, 'throttled': 0, 'disambiguations': 0}
+        self._properties = {}
+
+        with open(OUTCODES_JSON) as f:
+            self.outcodeNames = {str(code): outcode for outcode, code in json.load(f).items()}
+        self.url = None
+        self._runner = None
+        self._loop = None
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_get('/api/{propType}/find', self.rightmove_find)
+        app.router.add_get('/Journey/JourneyResults/{start}/to/{end}', self.tfl_journey)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = 'http://127.0.0.1:{}/'.format(port)
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def serve_in_thread(self, port=0):
+        '''
+        Runs the server on its own event loop in a daemon thread (so it doesn't compete with the clients' loop) and
+        returns its url.
+        '''
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start(port))
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        return self.url
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _fault(self):
+        self.counts['requests'] += 1
+        await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+        roll = self.random.random()
+        if roll < self.errorRate:
+            self.counts['errors'] += 1
+            return web.json_response({'message': 'Internal Server Error'}, status=500)
+        if roll < self.errorRate + self.throttleRate:
+            self.counts['throttled'] += 1
+            return web.json_response({'message': 'Too Many Requests'}, status=429, headers={'Retry-After': str(self.retryAfter)})
+        return None
+
+    async def rightmove_find(self, request):
+        fault = await self._fault()
+        if fault is not None:
+            return fault
+        query = request.query
+        code = query['locationIdentifier'].split('^')[-1]
+        name = self.outcodeNames.get(code, code)
+        index = int(query.get('index', 0))
+        perPage = int(query.get('numberOfPropertiesRequested', 50))
+
+        properties = self._rightmove_properties(name, code)
+        return web.json_response({
+            'result': 'SUCCESS', 'createDate': 0, 'radius': 0.0, 'searchableLocation': {'name': name},
+            'totalAvailableResults': len(properties), 'numReturnedResults': len(properties[index:index + perPage]),
+            'properties': properties[index:index + perPage]})
+
+    def _rightmove_properties(self, name, code):
+        if name in self.rightmoveResults:
+            return self.rightmoveResults[name]['properties']
+        if name not in self._properties:
+            self._properties[name] = self._synthetic_properties(name, code)
+        return self._properties[name]
+
+    def _synthetic_properties(self, name, code):
+        rnd = random.Random(zlib.crc32(name.encode()))
+        count = rnd.randint(*self.propertiesPerOutcode)
+        lat, lng = 51.3 + rnd.random() * 0.4, -0.5 + rnd.random() * 0.7
+        return [{
+            'identifier': int(code) * 100000 + i, 'latitude': lat + rnd.random() * 0.01, 'longitude': lng + rnd.random() * 0.01,
+            'price': rnd.randint(800, 4000), 'propertyType': rnd.choice(('flat', 'terraced', 'semi-detached')),
+            'bedrooms': rnd.randint(0, 4), 'commercial': False, 'branch': {'name': 'Agent'}, 'displayPrices': [],
+            'summary': 'A property in {}'.format(name), 'autoEmailReasonType': 'new'} for i in range(count)]
+
+    async def tfl_journey(self, request):
+        fault = await self._fault()
+        if fault is not None:
+            return fault
+        start, end = request.match_info['start'], request.match_info['end']
+        if ',' not in start and zlib.crc32(start.encode()) / 2**32 < self.disambiguationRate:
+            self.counts['disambiguations'] += 1
+            return web.json_response({'$type': 'Tfl.Api.Presentation.Entities.JourneyPlanner.DisambiguationResult'}, status=300)
+        if start in self.tflResults:
+            return web.json_response(self.tflResults[start])
+        return web.json_response(synthetic_journey(start, end, request.query.get('date', ''), request.query.get('time', '')))
+
+
+def synthetic_journey(start, end, date='', time=''):
+    rnd = random.Random(zlib.crc32((start + end).encode()))
+    journeys = []
+    for _ in range(3):
+        legs = [{'duration': rnd.randint(1, 25), 'mode': {'id': mode, 'name': mode},
+                 'instruction': {'summary': 'Take the {} towards {}'.format(mode, end)}}
+                for mode in ['walking'] + rnd.sample(('bus', 'tube', 'overground', 'dlr'), rnd.randint(1, 3)) + ['walking']]
+        journeys.append({'duration': sum(leg['duration'] for leg in legs), 'legs': legs})
+    dateTime = '{}-{}-{}T{}:{}:00'.format(date[:4], date[4:6], date[6:], time[:2], time[2:]) if date and time else ''
+    return {'journeyVector': {'from': start, 'to': end}, 'searchCriteria': {'dateTime': dateTime, 'dateTimeType': 'Departing'},
+            'recommendedMaxAgeMinutes': 60, 'journeys': journeys}